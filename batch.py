@@ -0,0 +1,227 @@
+import os
+import time
+import threading
+import contextvars
+from typing import get_type_hints
+from concurrent.futures import ThreadPoolExecutor, Future, as_completed
+
+from metrics import traced, trace_run
+from deadline import with_deadline
+from resilience import provider_status
+from main import (
+    AgentState, NODE_SPECS, NODE_DEPENDENCIES, get_llm, initial_state,
+    google_analysis_prompt, duckduckgo_analysis_prompt, reddit_analysis_prompt,
+    conflict_update, synthesis_prompt, synthesis_result,
+)
+
+# --- BATCH RESEARCH ---
+# For sweeps over many questions. Duplicate questions run once. Up to
+# BATCH_IN_FLIGHT questions are researched at a time, each walking the
+# graph's dependency levels on its own, and each result is yielded as soon
+# as its question is done. Search and scrape nodes share a pool of
+# BATCH_MAX_CONCURRENCY threads; identical searches meet in the search cache
+# and single-flight. LLM prompts (analyses, conflict detection, synthesis)
+# that concurrent questions send within BATCH_LLM_WINDOW seconds of each
+# other go out as one llm.batch call. Every node keeps its latency budget
+# cut-off. Batch runs are not checkpointed.
+
+BATCH_IN_FLIGHT = int(os.getenv("BATCH_IN_FLIGHT", "16"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "8"))
+BATCH_LLM_WINDOW = float(os.getenv("BATCH_LLM_WINDOW", "0.05"))
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", "500"))
+
+# Keys with a reducer (missing_sources) are combined the way the graph would
+_REDUCERS = {
+    key: hint.__metadata__[0]
+    for key, hint in get_type_hints(AgentState, include_extras=True).items()
+    if hasattr(hint, "__metadata__")
+}
+
+def normalize_question(question):
+    return " ".join(question.split()).casefold()
+
+def dependency_levels(deps):
+    # Nodes grouped by their longest distance from START
+    depth = {}
+    for name in deps:
+        depth[name] = 1 + max((depth[dep] for dep in deps[name]), default=-1)
+    return [[name for name in deps if depth[name] == level] for level in range(max(depth.values(), default=-1) + 1)]
+
+def _merge(state, update):
+    for key, value in (update or {}).items():
+        state[key] = _REDUCERS[key](state.get(key, []), value) if key in _REDUCERS else value
+
+
+# --- LLM BATCHING ---
+@traced("tool", "llm_batch")
+def _batch_prompts(runnable, prompts, max_concurrency):
+    return runnable.batch(prompts, config={"max_concurrency": max_concurrency}, return_exceptions=True)
+
+class _PromptBatcher:
+    # Prompts for the same runnable are held for `window` seconds from the
+    # first one, then sent together; each caller gets a future of its response
+    def __init__(self, max_concurrency, window=BATCH_LLM_WINDOW):
+        self.max_concurrency = max_concurrency
+        self.window = window
+        self._groups = {}  # key -> (runnable factory, [(prompt, future)])
+        self._lock = threading.Lock()
+
+    def submit(self, key, make_runnable, prompt):
+        future = Future()
+        with self._lock:
+            group = self._groups.get(key)
+            if group is None:
+                group = self._groups[key] = (make_runnable, [])
+                timer = threading.Timer(self.window, self._flush, (key, group))
+                timer.daemon = True
+                timer.start()
+            group[1].append((prompt, future))
+        return future
+
+    def _flush(self, key, group):
+        with self._lock:
+            del self._groups[key]  # later prompts start a new group
+        make_runnable, items = group
+        try:
+            responses = _batch_prompts(make_runnable(), [prompt for prompt, _ in items], self.max_concurrency)
+        except Exception as e:
+            responses = [e] * len(items)
+        for (_, future), response in zip(items, responses):
+            future.set_result(response)
+
+class _BatchedRunnable:
+    # The invoke/batch side of a runnable, with the calls going through the batcher
+    def __init__(self, batcher, key, make_runnable):
+        self._batcher = batcher
+        self._key = key
+        self._make_runnable = make_runnable
+
+    def invoke(self, prompt):
+        return self.batch([prompt])[0]
+
+    def batch(self, prompts, config=None, return_exceptions=False):
+        futures = [self._batcher.submit(self._key, self._make_runnable, prompt) for prompt in prompts]
+        responses = [future.result() for future in futures]
+        if not return_exceptions:
+            for response in responses:
+                if isinstance(response, Exception):
+                    raise response
+        return responses
+
+class _BatchedLLM(_BatchedRunnable):
+    # Stands in for get_llm() in the batch versions of the LLM nodes;
+    # structured calls are grouped per schema
+    def __init__(self, batcher):
+        super().__init__(batcher, "text", get_llm)
+
+    def with_structured_output(self, schema, **kwargs):
+        key = ("structured", schema, repr(sorted(kwargs.items())))
+        return _BatchedRunnable(self._batcher, key, lambda: get_llm().with_structured_output(schema, **kwargs))
+
+
+# --- NODES ---
+def _analysis(prompt, key):
+    def node(state, llm):
+        messages, update = prompt(state)
+        if messages is None:
+            return update
+        return {**update, key: llm.invoke(messages).content}
+    return node
+
+def _synthesize(state, llm):
+    status = provider_status()
+    try:
+        return synthesis_result(state, status, llm.invoke(synthesis_prompt(state)).content)
+    except Exception as e:
+        return synthesis_result(state, status, error=e)
+
+# node -> batch version of the node, called with the state and the batched LLM
+LLM_NODES = {
+    "analyze_google": _analysis(google_analysis_prompt, "google_analysis"),
+    "analyze_duckduckgo": _analysis(duckduckgo_analysis_prompt, "duckduckgo_analysis"),
+    "analyze_reddit": _analysis(reddit_analysis_prompt, "reddit_analysis"),
+    "conflict_detector": conflict_update,
+    "synthesize": _synthesize,
+}
+LEVELS = dependency_levels(NODE_DEPENDENCIES)
+
+def _bind(name, node, llm):
+    # Same trace name and latency budget cut-off as the graph's node
+    def run(state):
+        return node(state, llm)
+    run.__name__ = name
+    return traced("node", name)(with_deadline(*NODE_SPECS[name][0].deadline)(run))
+
+def _nodes(batcher):
+    llm = _BatchedLLM(batcher)
+    return {
+        name: _bind(name, LLM_NODES[name], llm) if name in LLM_NODES else traced("node", name)(node)
+        for name, (node, _, _) in NODE_SPECS.items()
+    }
+
+
+# --- RUNNER ---
+def _result(question, state, error=None):
+    if error is not None:
+        return {"question": question, "error": str(error)}
+    return {
+        "question": question,
+        "final_answer": state.get("final_answer"),
+        "conflict_report": state.get("conflict_report", {}),
+        "missing_sources": list(dict.fromkeys(state.get("missing_sources", []))),
+        "provider_status": state.get("provider_status", {}),
+    }
+
+def _research(question, nodes, pools, latency_budget, overrides):
+    # The whole graph for one question; LLM nodes wait on the batcher in their own pool
+    started = time.time()
+    with trace_run("research_batch"):
+        state = initial_state(question, latency_budget, **overrides)
+        for level in LEVELS:
+            futures = [
+                (name, pools[name in LLM_NODES].submit(contextvars.copy_context().run, nodes[name], dict(state)))
+                for name in level
+            ]
+            for name, future in futures:
+                try:
+                    _merge(state, future.result())
+                except Exception as e:
+                    print(f"--- [Batch] {name} failed for {question!r}: {e} ---")
+                    return {**_result(question, state, e), "elapsed": time.time() - started}
+    return {**_result(question, state), "elapsed": time.time() - started}
+
+def run_batch(questions, max_concurrency=None, in_flight=None, latency_budget=None, **overrides):
+    # Yields one result dict per input question (duplicates included, with
+    # their own index) as each question completes, in completion order
+    max_concurrency = max_concurrency or BATCH_MAX_CONCURRENCY
+    in_flight = in_flight or BATCH_IN_FLIGHT
+    positions = {}
+    for index, question in enumerate(questions):
+        positions.setdefault(normalize_question(question), []).append(index)
+    unique = [questions[indexes[0]] for indexes in positions.values()]
+    print(f"--- [Batch] {len(questions)} questions, {len(unique)} unique, {in_flight} at a time ---")
+
+    nodes = _nodes(_PromptBatcher(max_concurrency))
+    llm_workers = in_flight * max(sum(name in LLM_NODES for name in level) for level in LEVELS)
+    question_pool = ThreadPoolExecutor(max_workers=in_flight, thread_name_prefix="batch")
+    pools = {
+        False: ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="batch-node"),
+        True: ThreadPoolExecutor(max_workers=llm_workers, thread_name_prefix="batch-llm"),
+    }
+    try:
+        futures = {
+            question_pool.submit(_research, question, nodes, pools, latency_budget, overrides): question
+            for question in unique
+        }
+        for future in as_completed(futures):
+            question = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {**_result(question, {}, e), "elapsed": 0.0}
+            for index in positions[normalize_question(question)]:
+                yield {"index": index, **result}
+    finally:
+        # A consumer that stops early does not wait for the remaining questions
+        for pool in (question_pool, *pools.values()):
+            pool.shutdown(wait=False, cancel_futures=True)
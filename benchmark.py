@@ -0,0 +1,549 @@
+import os
+import re
+import json
+import time
+import random
+import asyncio
+import subprocess
+import sys
+import argparse
+import threading
+import typing
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Offline benchmark: SerpApi, DuckDuckGo, Reddit and Gemini are replaced by
+# local stand-ins with configurable latency, jitter, payload size and failure
+# rate, so the pipeline can be measured without keys or network access.
+#
+#   python benchmark.py --runs 20 --concurrency 4
+#   python benchmark.py --gemini-latency 1.5 --failure-rate 0.05 --json baseline.json
+#   python benchmark.py --imports-only --max-import-ms 1500
+
+os.environ.setdefault("GOOGLE_API_KEY", "offline-benchmark")
+os.environ.setdefault("SERP_API_KEY", "offline-benchmark")
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.runnables import RunnableLambda
+from pydantic import BaseModel
+
+_rng = random.Random(0)
+_rng_lock = threading.Lock()
+
+# --- STAND-IN BEHAVIOUR ---
+class FakeProfile:
+    def __init__(self, latency=0.2, jitter=0.05, payload_bytes=2000, failure_rate=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.payload_bytes = payload_bytes
+        self.failure_rate = failure_rate
+
+    def simulate(self, name):
+        with _rng_lock:
+            delay = max(0.0, self.latency + _rng.uniform(-self.jitter, self.jitter))
+            failed = _rng.random() < self.failure_rate
+        time.sleep(delay)
+        if failed:
+            raise ConnectionError(f"simulated {name} failure")
+
+    def text(self, size=None):
+        words = ["lorem", "ipsum", "battery", "price", "review", "reliable", "cheap", "warranty", "fast", "slow"]
+        size = self.payload_bytes if size is None else size
+        out, length = [], 0
+        while length < size:
+            with _rng_lock:
+                word = _rng.choice(words)
+            out.append(word)
+            length += len(word) + 1
+        return " ".join(out)
+
+PROFILES = {}
+page_base = None  # stand-in server for result pages (--page-fetch); None keeps unreachable example.com links
+
+# --- SERPAPI STAND-IN ---
+class FakeGoogleSearch:
+    reddit_base = "http://127.0.0.1:0"
+
+    def __init__(self, params):
+        self.params = params
+
+    def get_dict(self):
+        profile = PROFILES["serpapi"]
+        profile.simulate("serpapi")
+        query = self.params["q"]
+        num = self.params.get("num", 5)
+        snippet_size = profile.payload_bytes // max(1, num)
+        results = []
+        for i in range(num):
+            if query.startswith("site:reddit.com"):
+                link = f"{self.reddit_base}/r/bench/comments/t{abs(hash((query, i))) % 10**8}/thread_{i}/"
+            else:
+                link = f"{page_base or 'https://example.com'}/pages/{abs(hash((query, i))) % 10**8}/page-{i}"
+            results.append({"title": f"{query} result {i}", "link": link, "snippet": profile.text(snippet_size)})
+        return {"organic_results": results}
+
+# --- DUCKDUCKGO STAND-IN ---
+class FakeDDGS:
+    def text(self, keywords, max_results=5):
+        profile = PROFILES["duckduckgo"]
+        profile.simulate("duckduckgo")
+        snippet_size = profile.payload_bytes // max(1, max_results)
+        return [
+            {"title": f"{keywords} ddg {i}", "href": f"{page_base or 'https://example.org'}/pages/ddg/{i}", "body": profile.text(snippet_size)}
+            for i in range(max_results)
+        ]
+
+# --- REDDIT STAND-IN (local HTTP server; also serves the result pages) ---
+class RedditHandler(BaseHTTPRequestHandler):
+    low_score_rate = 0.0  # share of threads posted with score 0 (comments skipped in bulk mode)
+    requests = {"by_id": 0, "thread": 0, "page": 0}
+    _requests_lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        if path.startswith("/pages/"):
+            self._send_page(path)
+            return
+        profile = PROFILES["reddit"]
+        try:
+            profile.simulate("reddit")
+        except ConnectionError:
+            self._send(503, b'{"error": 503}')
+            return
+        if path.startswith("/by_id/"):
+            # /by_id/t3_a,t3_b.json: one listing with the post data of every thread
+            self._count("by_id")
+            names = path[len("/by_id/"):].removesuffix(".json").split(",")
+            posts = [reddit_post(name.removeprefix("t3_"), profile) for name in names]
+            self._send(200, json.dumps({"kind": "Listing", "data": {"children": posts}}).encode("utf-8"))
+            return
+        self._count("thread")
+        thread_id = path.strip("/").split("/")[3] if path.count("/") > 3 else "t0"
+        body = json.dumps(reddit_thread_payload(thread_id, profile)).encode("utf-8")
+        self._send(200, body)
+
+    @classmethod
+    def _count(cls, kind):
+        with cls._requests_lock:
+            cls.requests[kind] += 1
+
+    def _send_page(self, path):
+        self._count("page")
+        try:
+            PROFILES["page"].simulate("page")
+        except ConnectionError:
+            self._send(503, b"unavailable", "text/plain")
+            return
+        # Every fifth link is a PDF, which the page fetcher should skip unread
+        if path.endswith(("/4", "-4")):
+            self._send(200, b"%PDF-1.4 " + b"0" * 4096, "application/pdf")
+            return
+        self._send(200, page_html(path, PROFILES["page"]).encode("utf-8"), "text/html; charset=utf-8")
+
+    def _send(self, status, body, content_type="application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def reddit_thread_payload(thread_id, profile, comments=20):
+    comment_size = profile.payload_bytes // comments
+    children = []
+    for i in range(comments):
+        with _rng_lock:
+            score = _rng.randint(-5, 500)
+        # Every other comment has a short reply, so the depth weighting is exercised
+        replies = {"kind": "Listing", "data": {"children": [{"kind": "t1", "data": {
+            "id": f"c{i}r", "body": profile.text(comment_size // 4), "score": score // 2, "replies": "",
+        }}]}} if i % 2 else ""
+        children.append({"kind": "t1", "data": {
+            "id": f"c{i}", "body": profile.text(comment_size), "score": score, "replies": replies,
+        }})
+    return [
+        {"kind": "Listing", "data": {"children": [reddit_post(thread_id, profile, comments)]}},
+        {"kind": "Listing", "data": {"after": None, "dist": None, "modhash": "", "children": children, "before": None}},
+    ]
+
+def reddit_post(thread_id, profile, comments=20):
+    # Same score for a thread in /by_id/ and in its own .json; the title shares
+    # words with the benchmark questions so it passes the relevance check
+    low_score = random.Random(thread_id).random() < RedditHandler.low_score_rate
+    return {"kind": "t3", "data": {
+        "id": thread_id, "name": f"t3_{thread_id}", "title": f"Benchmark question thread {thread_id}",
+        "selftext": profile.text(200), "score": 0 if low_score else 100, "num_comments": comments,
+    }}
+
+def page_html(path, profile):
+    # Boilerplate around an <article>, the way real pages arrive
+    paragraphs = "".join(f"<p>Benchmark question detail {i}: {profile.text(profile.payload_bytes // 8)}</p>" for i in range(6))
+    return (
+        f"<!doctype html><html><head><title>{path}</title><script>var tracking = {{}};</script>"
+        f"<style>body {{ margin: 0 }}</style></head><body>"
+        f"<nav><a href='/'>Home</a> <a href='/about'>About this benchmark site and its many sections</a></nav>"
+        f"<article><h1>Stand-in page {path}</h1>{paragraphs}</article>"
+        f"<footer>Copyright benchmark stand-in, all rights reserved, no warranty of any kind</footer></body></html>"
+    )
+
+def start_reddit_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), RedditHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+# --- GEMINI STAND-IN ---
+class FakeGemini(BaseChatModel):
+    model: str = "fake-gemini"
+    output_words: int = 150
+    stream_delay: float = 0.0
+
+    @property
+    def _llm_type(self):
+        return "fake-gemini"
+
+    def _usage(self, messages, output_text):
+        input_tokens = sum(len(str(m.content)) for m in messages) // 4
+        output_tokens = len(output_text) // 4
+        return {"input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens}
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        PROFILES["gemini"].simulate("gemini")
+        text = PROFILES["gemini"].text(self.output_words * 6)
+        message = AIMessage(content=text, usage_metadata=self._usage(messages, text))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        PROFILES["gemini"].simulate("gemini")
+        for word in PROFILES["gemini"].text(self.output_words * 6).split(" "):
+            if self.stream_delay:
+                time.sleep(self.stream_delay)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word + " "))
+
+    def with_structured_output(self, schema, include_raw=False, **kwargs):
+        def run(model_input):
+            text = model_input if isinstance(model_input, str) else "\n".join(str(m.content) for m in model_input)
+            PROFILES["gemini"].simulate("gemini")
+            parsed = fake_structured(schema, text)
+            if not include_raw:
+                return parsed
+            raw = AIMessage(content="", usage_metadata={"input_tokens": len(text) // 4, "output_tokens": 200, "total_tokens": len(text) // 4 + 200})
+            return {"raw": raw, "parsed": parsed, "parsing_error": None}
+        return RunnableLambda(run)
+
+def fake_structured(schema, prompt_text, index=0):
+    values = {}
+    urls = re.findall(r"https?://\S+?(?=[\s)]|$)", prompt_text)
+    for name, field in schema.model_fields.items():
+        annotation = str(field.annotation)
+        item_type = (typing.get_args(field.annotation) or [None])[0]
+        if name == "selected_urls":
+            values[name] = urls[:3]
+        elif isinstance(item_type, type) and issubclass(item_type, BaseModel):
+            values[name] = [fake_structured(item_type, prompt_text, i + 1) for i in range(3)]
+        elif "List" in annotation or "list" in annotation:
+            values[name] = [f"{name} item {i}" for i in range(3)]
+        elif field.annotation is float or field.annotation is int:
+            values[name] = index
+        else:
+            values[name] = f"fake {name}"
+    return schema.model_validate(values)
+
+# --- INSTALL ---
+def install_fakes(args):
+    for name in ("serpapi", "duckduckgo", "reddit", "page", "gemini"):
+        PROFILES[name] = FakeProfile(
+            latency=getattr(args, f"{name}_latency"),
+            jitter=args.jitter,
+            payload_bytes=args.payload_bytes,
+            failure_rate=args.failure_rate,
+        )
+
+    import web_operations
+    web_operations.GoogleSearch = FakeGoogleSearch
+    web_operations.DDGS = FakeDDGS
+
+    reddit_server = start_reddit_server()
+    FakeGoogleSearch.reddit_base = f"http://127.0.0.1:{reddit_server.server_address[1]}"
+    web_operations.REDDIT_BASE_URL = FakeGoogleSearch.reddit_base
+    RedditHandler.low_score_rate = args.reddit_low_score_rate
+
+    import main
+    if args.page_fetch:
+        global page_base
+        page_base = FakeGoogleSearch.reddit_base
+        main.PAGE_FETCH = True
+    from llm_cache import CachedChatModel
+    # main and server share one lazily built client; installing the stand-in
+    # first means the Gemini SDK is never imported
+    main._llm = CachedChatModel(FakeGemini(stream_delay=args.stream_delay))
+    return reddit_server
+
+def reset_caches():
+    from cache import search_cache
+    from llm_cache import llm_cache
+    from page_fetch import page_cache
+    search_cache.clear()
+    llm_cache.clear()
+    page_cache.clear()
+
+def reset_rate_limits():
+    # Fresh buckets, so one section does not inherit the quota another used up
+    from ratelimit import rate_limiters, MemoryBackend
+    backend = MemoryBackend()
+    for limiter in rate_limiters.values():
+        if isinstance(limiter.backend, MemoryBackend):
+            limiter.backend = backend
+
+# --- REPORTING ---
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * (len(ordered) - 1)))))
+    return ordered[index]
+
+def summarize(values):
+    return {
+        "count": len(values),
+        "mean": sum(values) / len(values) if values else 0.0,
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": max(values) if values else 0.0,
+    }
+
+def print_table(title, rows):
+    print(f"\n{title}")
+    print(f"{'name':<28}{'n':>6}{'mean':>10}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}")
+    for name, stats in rows.items():
+        print(f"{name:<28}{stats['count']:>6}{stats['mean']:>10.3f}{stats['p50']:>10.3f}"
+              f"{stats['p95']:>10.3f}{stats['p99']:>10.3f}{stats['max']:>10.3f}")
+
+# --- GRAPH BENCHMARK ---
+def bench_graph(args):
+    import main
+    from metrics import trace_run
+    from checkpoints import run_config
+    from topology import print_report
+
+    latencies, first_tokens, node_times, failures = [], [], {}, 0
+
+    def one_run(i):
+        if not args.cache:
+            reset_caches()
+        first_token = []
+        with trace_run("benchmark") as run_trace:
+            started = time.perf_counter()
+            main.run_graph(
+                main.initial_state(f"benchmark question {i}"), run_config(),
+                on_token=lambda text: first_token or first_token.append(time.perf_counter() - started),
+            )
+            elapsed = time.perf_counter() - started
+        return elapsed, first_token, run_trace.to_dict()["spans"]
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        for future in [executor.submit(one_run, i) for i in range(args.runs)]:
+            try:
+                elapsed, first_token, spans = future.result()
+            except Exception as e:
+                failures += 1
+                print(f"Run failed: {e}")
+                continue
+            latencies.append(elapsed)
+            first_tokens.extend(first_token)
+            for record in spans:
+                if record["kind"] == "node":
+                    node_times.setdefault(record["name"], []).append(record["end_time"] - record["start_time"])
+    wall = time.perf_counter() - started
+
+    rows = {"end_to_end": summarize(latencies), "first_token": summarize(first_tokens)}
+    rows.update({name: summarize(times) for name, times in sorted(node_times.items())})
+    print_table(f"graph.invoke  runs={args.runs} concurrency={args.concurrency} failures={failures}", rows)
+    throughput = len(latencies) / wall if wall else 0.0
+    print(f"throughput: {throughput:.2f} runs/s ({throughput * 60:.1f} questions/min)")
+
+    # Replay the median node times on the graph's dependency DAG
+    durations = {name: rows[name]["p50"] for name in main.NODE_DEPENDENCIES if name in rows}
+    path = print_report(main.NODE_DEPENDENCIES, durations, " (p50)")
+    return {"latency": rows, "throughput": throughput, "failures": failures, "critical_path": path}
+
+# --- BATCH BENCHMARK ---
+def bench_batch(args):
+    # Same number of questions as the graph benchmark, through batch.run_batch
+    from batch import run_batch
+
+    if not args.cache:
+        reset_caches()
+    reset_rate_limits()
+    # A graph run keeps up to three branches in flight, so this matches bench_graph
+    concurrency = args.concurrency * 3
+    questions = [f"benchmark question {i}" for i in range(args.runs)]
+    latencies, errors = [], 0
+    started = time.perf_counter()
+    for result in run_batch(questions, max_concurrency=concurrency):
+        latencies.append(time.perf_counter() - started)
+        errors += "error" in result
+    wall = time.perf_counter() - started
+
+    rows = {"time_to_result": summarize(latencies)}
+    print_table(f"batch  questions={args.runs} concurrency={concurrency} errors={errors}", rows)
+    per_minute = len(latencies) / wall * 60 if wall else 0.0
+    print(f"throughput: {per_minute:.1f} questions/min")
+    return {"latency": rows, "questions_per_minute": per_minute, "errors": errors}
+
+# --- API BENCHMARK ---
+async def _bench_endpoints(args):
+    import httpx
+    import server
+
+    def payload(path, i):
+        if path == "/api/analyze/conflicts":
+            return {"google_results": [{"title": "t", "snippet": PROFILES["serpapi"].text(300)}],
+                    "reddit_results": [PROFILES["reddit"].text(600)]}
+        return {"query": f"benchmark api question {i}"}
+
+    endpoints = ["/api/search/google", "/api/search/reddit", "/api/analyze/conflicts", "/api/research/stream"]
+    semaphore = asyncio.Semaphore(args.concurrency)
+    results = {}
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://bench", timeout=None) as client:
+        for path in endpoints:
+            latencies, errors = [], 0
+
+            async def call(i):
+                nonlocal errors
+                async with semaphore:
+                    started = time.perf_counter()
+                    response = await client.post(path, json=payload(path, i))
+                    if response.status_code != 200:
+                        errors += 1
+                        return
+                    latencies.append(time.perf_counter() - started)
+
+            if not args.cache:
+                reset_caches()
+            started = time.perf_counter()
+            await asyncio.gather(*(call(i) for i in range(args.runs)))
+            wall = time.perf_counter() - started
+            results[path] = {**summarize(latencies), "errors": errors, "throughput": len(latencies) / wall if wall else 0.0}
+
+    print_table(f"FastAPI endpoints  requests={args.runs} concurrency={args.concurrency}", results)
+    for path, stats in results.items():
+        print(f"{path:<28} throughput {stats['throughput']:.2f} req/s, errors {stats['errors']}")
+    return results
+
+def bench_api(args):
+    return asyncio.run(_bench_endpoints(args))
+
+# --- IMPORT-TIME BENCHMARK ---
+IMPORT_MODULES = ("main", "server")
+_IMPORTTIME_RE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+def import_profile(module):
+    # Cold import in a fresh interpreter under -X importtime; returns
+    # (total seconds, [(cumulative seconds, name) of the top-level imports])
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True,
+        env={**os.environ, "PREWARM": "0"},
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"importing {module} failed:\n{result.stderr[-2000:]}")
+    total, children = 0.0, []
+    for line in result.stderr.splitlines():
+        match = _IMPORTTIME_RE.match(line)
+        if not match:
+            continue
+        cumulative, depth, name = int(match.group(2)) / 1e6, len(match.group(3)), match.group(4)
+        if name == module and depth == 1:
+            total = cumulative
+        elif depth == 3:
+            children.append((cumulative, name))
+    return total, sorted(children, reverse=True)
+
+def bench_imports(args):
+    rows, heaviest = {}, {}
+    for module in IMPORT_MODULES:
+        samples = []
+        for _ in range(args.import_runs):
+            total, children = import_profile(module)
+            samples.append(total)
+        rows[f"import {module}"] = summarize(samples)
+        heaviest[module] = [{"module": name, "seconds": seconds} for seconds, name in children[:5]]
+    print_table(f"cold import  runs={args.import_runs}", rows)
+    for module, top in heaviest.items():
+        print(f"{module}: " + ", ".join(f"{t['module']} {t['seconds'] * 1000:.0f}ms" for t in top))
+
+    over = [name for name, stats in rows.items() if args.max_import_ms and stats["p50"] * 1000 > args.max_import_ms]
+    if over:
+        print(f"Import budget of {args.max_import_ms}ms exceeded by: {', '.join(over)}")
+    return {"latency": rows, "heaviest": heaviest, "over_budget": over}
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline latency/throughput benchmark for the research pipeline")
+    parser.add_argument("--runs", type=int, default=10, help="graph runs / requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--serpapi-latency", type=float, default=0.4, help="seconds")
+    parser.add_argument("--duckduckgo-latency", type=float, default=0.3, help="seconds")
+    parser.add_argument("--reddit-latency", type=float, default=0.5, help="seconds per thread request")
+    parser.add_argument("--page-latency", type=float, default=0.3, help="seconds per result page (with --page-fetch)")
+    parser.add_argument("--gemini-latency", type=float, default=1.0, help="seconds per LLM call")
+    parser.add_argument("--reddit-low-score-rate", type=float, default=0.3,
+                        help="share of Reddit threads with score 0, whose comments bulk mode skips")
+    parser.add_argument("--stream-delay", type=float, default=0.0, help="seconds between streamed LLM tokens")
+    parser.add_argument("--jitter", type=float, default=0.1, help="uniform +/- seconds added to every latency")
+    parser.add_argument("--payload-bytes", type=int, default=4000, help="approximate response body size")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="probability that a stand-in call fails")
+    parser.add_argument("--page-fetch", action="store_true", help="enrich web results with excerpts of their (stand-in) pages")
+    parser.add_argument("--cache", action="store_true", help="keep search/LLM caches warm between runs")
+    parser.add_argument("--skip-graph", action="store_true")
+    parser.add_argument("--skip-api", action="store_true")
+    parser.add_argument("--skip-batch", action="store_true")
+    parser.add_argument("--skip-imports", action="store_true")
+    parser.add_argument("--imports-only", action="store_true", help="only measure cold import time of main/server")
+    parser.add_argument("--import-runs", type=int, default=3)
+    parser.add_argument("--max-import-ms", type=float, default=0, help="exit with status 1 if a cold import's median is slower")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write the report to this file (regression baseline)")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    _rng.seed(args.seed)
+    report = {"config": vars(args)}
+    # Before install_fakes, which imports main into this process
+    if not args.skip_imports:
+        report["imports"] = bench_imports(args)
+    if args.imports_only:
+        args.skip_graph = args.skip_api = args.skip_batch = True
+    reddit_server = install_fakes(args)
+    try:
+        if not args.skip_graph:
+            report["graph"] = bench_graph(args)
+        if not args.skip_batch:
+            report["batch"] = bench_batch(args)
+        if not args.skip_api:
+            report["api"] = bench_api(args)
+        if not (args.skip_graph and args.skip_api):
+            report["reddit_requests"] = dict(RedditHandler.requests)
+            requests = report["reddit_requests"]
+            print(f"\nStand-in requests: {requests['thread']} thread, {requests['by_id']} by_id, {requests['page']} page")
+    finally:
+        reddit_server.shutdown()
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.json}")
+    return report
+
+if __name__ == "__main__":
+    report = main()
+    if report.get("imports", {}).get("over_budget"):
+        sys.exit(1)
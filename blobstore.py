@@ -0,0 +1,245 @@
+import os
+import json
+import time
+import zlib
+import hashlib
+import functools
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from metrics import register_stats
+
+try:
+    import zstandard
+except ImportError:  # zstd is optional; zlib is used instead
+    zstandard = None
+
+# --- CONTENT-ADDRESSED BLOB STORE ---
+# Large state values are stored once, compressed, under the SHA-256 of their
+# JSON encoding. This covers result lists, scraped threads and analyses. The
+# graph state and its checkpoints hold {"$blob": digest} instead, so equal
+# values (a re-run question, a forked re-synthesis) share one blob. Values
+# smaller than min_bytes stay inline. A memory LRU of compressed blobs sits
+# in front of an optional SQLite file, which is LRU-evicted by size. A
+# reference to an evicted blob can no longer be resolved.
+
+BLOB_STORE = os.getenv("BLOB_STORE", "1") == "1"
+BLOB_MIN_BYTES = int(os.getenv("BLOB_MIN_BYTES", "1024"))
+BLOB_COMPRESSION = os.getenv("BLOB_COMPRESSION", "zstd" if zstandard is not None else "zlib")
+BLOB_COMPRESSION_LEVEL = int(os.getenv("BLOB_COMPRESSION_LEVEL", "3"))
+
+REF_KEY = "$blob"
+_CODECS = {"zstd": b"Z", "zlib": b"z"}  # first byte of every stored blob
+
+def is_ref(value):
+    return isinstance(value, dict) and len(value) == 1 and REF_KEY in value
+
+class BlobStore:
+    def __init__(self, name, max_bytes=None, sqlite_path=None, max_disk_bytes=None,
+                 compression=BLOB_COMPRESSION, level=BLOB_COMPRESSION_LEVEL, min_bytes=BLOB_MIN_BYTES, enabled=True):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.sqlite_path = sqlite_path
+        self.max_disk_bytes = max_disk_bytes
+        self.compression = "zlib" if compression == "zstd" and zstandard is None else compression
+        self.level = level
+        self.min_bytes = min_bytes
+        self.enabled = enabled
+
+        self._entries = OrderedDict()  # digest -> compressed blob
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._db = None  # opened on first disk access
+        self._disk_bytes = 0  # running total of the blobs table, so puts need no SUM()
+        self._stats = {
+            "puts": 0, "inline": 0, "deduplicated": 0, "gets": 0, "disk_hits": 0, "misses": 0,
+            "evictions": 0, "raw_bytes": 0, "stored_bytes": 0,
+        }
+
+    # --- Public API ---
+    def put(self, value):
+        # Returns a reference for value, or value itself when it is small or the store is off
+        if not self.enabled or is_ref(value):
+            return value
+        payload = json.dumps(value, separators=(",", ":")).encode("utf-8")
+        if len(payload) < self.min_bytes:
+            with self._lock:
+                self._stats["inline"] += 1
+            return value
+        digest = hashlib.sha256(payload).hexdigest()
+        with self._lock:
+            self._stats["puts"] += 1
+            if digest in self._entries:
+                self._entries.move_to_end(digest)
+                self._stats["deduplicated"] += 1
+                return {REF_KEY: digest}
+
+        blob = self._compress(payload)
+        with self._lock:
+            if self._connect() is None and self.max_bytes is not None and len(blob) > self.max_bytes:
+                # Nowhere to keep it: the value stays in the state
+                self._stats["inline"] += 1
+                return value
+            if self._disk_set(digest, blob):
+                self._stats["raw_bytes"] += len(payload)
+                self._stats["stored_bytes"] += len(blob)
+            else:
+                self._stats["deduplicated"] += 1
+            self._store(digest, blob)
+        return {REF_KEY: digest}
+
+    def resolve(self, value):
+        # The stored value for a reference; anything else is returned as is
+        if not is_ref(value):
+            return value
+        digest = value[REF_KEY]
+        with self._lock:
+            self._stats["gets"] += 1
+            blob = self._entries.get(digest)
+            if blob is not None:
+                self._entries.move_to_end(digest)
+            else:
+                blob = self._disk_get(digest)
+                if blob is None:
+                    self._stats["misses"] += 1
+                    raise KeyError(f"blob {digest} not found in store {self.name!r} (evicted?)")
+                self._stats["disk_hits"] += 1
+                self._store(digest, blob)
+        return json.loads(self._decompress(blob))
+
+    def missing(self, values):
+        # Digests of the references among values' top-level entries that can no longer be resolved
+        digests = [value[REF_KEY] for value in values.values() if is_ref(value)]
+        with self._lock:
+            return [digest for digest in digests if digest not in self._entries and not self._disk_has(digest)]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            if self._connect() is not None:
+                self._db.execute("DELETE FROM blobs")
+                self._disk_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            stored = self._stats["stored_bytes"]
+            return {
+                **self._stats,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "compression_ratio": self._stats["raw_bytes"] / stored if stored else 0.0,
+            }
+
+    # --- Compression ---
+    def _compress(self, payload):
+        if self.compression == "zstd":
+            return _CODECS["zstd"] + zstandard.ZstdCompressor(level=self.level).compress(payload)
+        return _CODECS["zlib"] + zlib.compress(payload, self.level)
+
+    def _decompress(self, blob):
+        # Blobs carry their codec, so a store can read what an older setting wrote
+        codec, data = blob[:1], blob[1:]
+        if codec == _CODECS["zstd"]:
+            if zstandard is None:
+                raise RuntimeError("blob was written with zstd, but the zstandard package is not installed")
+            return zstandard.ZstdDecompressor().decompress(data)
+        return zlib.decompress(data)
+
+    # --- Memory tier (caller holds the lock) ---
+    def _store(self, digest, blob):
+        if self.max_bytes is not None and len(blob) > self.max_bytes:
+            return
+        if digest in self._entries:
+            self._entries.move_to_end(digest)
+            return
+        self._entries[digest] = blob
+        self._bytes += len(blob)
+        while self.max_bytes is not None and self._bytes > self.max_bytes:
+            _, oldest = self._entries.popitem(last=False)
+            self._bytes -= len(oldest)
+            # Only a loss when there is no disk tier behind it
+            if self._connect() is None:
+                self._stats["evictions"] += 1
+
+    # --- Disk tier (caller holds the lock) ---
+    def _connect(self):
+        if self._db is None and self.sqlite_path:
+            self._db = sqlite3.connect(self.sqlite_path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS blobs (digest TEXT PRIMARY KEY, data BLOB, size INTEGER, accessed_at REAL)"
+            )
+            self._disk_bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+        return self._db
+
+    def _disk_get(self, digest):
+        if self._connect() is None:
+            return None
+        row = self._db.execute("SELECT data FROM blobs WHERE digest = ?", (digest,)).fetchone()
+        if row is None:
+            return None
+        self._db.execute("UPDATE blobs SET accessed_at = ? WHERE digest = ?", (time.time(), digest))
+        return bytes(row[0])
+
+    def _disk_has(self, digest):
+        if self._connect() is None:
+            return False
+        return self._db.execute("SELECT 1 FROM blobs WHERE digest = ?", (digest,)).fetchone() is not None
+
+    def _disk_set(self, digest, blob):
+        # False when the blob was already on disk
+        if self._connect() is None:
+            return digest not in self._entries
+        now = time.time()
+        inserted = self._db.execute(
+            "INSERT OR IGNORE INTO blobs (digest, data, size, accessed_at) VALUES (?, ?, ?, ?)",
+            (digest, blob, len(blob), now),
+        ).rowcount
+        if not inserted:
+            self._db.execute("UPDATE blobs SET accessed_at = ? WHERE digest = ?", (now, digest))
+            return False
+        self._disk_bytes += len(blob)
+        if self.max_disk_bytes is None or self._disk_bytes <= self.max_disk_bytes:
+            return True
+        # Evict least recently used blobs until we are back under budget
+        rows = self._db.execute("SELECT digest, size FROM blobs ORDER BY accessed_at ASC").fetchall()
+        for old_digest, old_size in rows:
+            if self._disk_bytes <= self.max_disk_bytes:
+                break
+            self._db.execute("DELETE FROM blobs WHERE digest = ?", (old_digest,))
+            self._disk_bytes -= old_size
+            self._stats["evictions"] += 1
+        return True
+
+
+# --- GRAPH STATE BLOBS ---
+# On disk by default, next to the checkpoints, so saved runs stay resumable
+# after a restart; BLOB_STORE_PATH="" keeps blobs in memory only.
+state_blobs = BlobStore(
+    "state",
+    max_bytes=int(os.getenv("BLOB_STORE_MAX_BYTES", "67108864")),
+    sqlite_path=os.getenv("BLOB_STORE_PATH", "blobs.sqlite") or None,
+    max_disk_bytes=int(os.getenv("BLOB_STORE_MAX_DISK_BYTES", "1073741824")),
+    enabled=BLOB_STORE,
+)
+register_stats("blob_store", "store", "state", state_blobs.stats)
+
+def with_blobs(node, reads, writes, keys, store=state_blobs):
+    # Wraps a graph node: the keys it reads are resolved for its call only,
+    # and the keys it writes are stored, so the state carries references
+    resolved = [key for key in reads if key in keys]
+    stored = [key for key in writes if key in keys]
+
+    @functools.wraps(node)
+    def run(state):
+        update = node({**state, **{key: store.resolve(state[key]) for key in resolved if key in state}})
+        if not update or not stored:
+            return update
+        return {**update, **{key: store.put(update[key]) for key in stored if key in update}}
+    return run
+
+def resolve_values(values, store=state_blobs):
+    # A copy of a state or node update with every top-level reference resolved
+    return {key: store.resolve(value) for key, value in values.items()}
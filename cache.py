@@ -0,0 +1,192 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from metrics import register_stats
+
+# --- TTL + LRU CACHE ---
+# Values are stored JSON-encoded, so every get() hands back a fresh copy and
+# the byte size used for eviction is the size of the encoded payload.
+class TTLCache:
+    def __init__(self, name, max_entries=1024, max_bytes=None, default_ttl=3600,
+                 sqlite_path=None, max_disk_bytes=None):
+        self.name = name
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.max_disk_bytes = max_disk_bytes
+
+        self._entries = OrderedDict()  # key -> (expires_at, size, payload)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "disk_hits": 0, "sets": 0, "evictions": 0, "expirations": 0}
+
+        self._db = None
+        self._disk_bytes = 0  # running total of this namespace's rows, so puts need no SUM()
+        if sqlite_path:
+            self._db = sqlite3.connect(sqlite_path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "namespace TEXT, key TEXT, payload TEXT, expires_at REAL, size INTEGER, accessed_at REAL, "
+                "PRIMARY KEY (namespace, key))"
+            )
+            self._disk_bytes = self._db.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM cache WHERE namespace = ?", (name,)
+            ).fetchone()[0]
+
+    # --- Public API ---
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, size, payload = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return True, json.loads(payload)
+                self._drop(key)
+                self._stats["expirations"] += 1
+
+            payload, expires_at = self._disk_get(key, now)
+            if payload is None:
+                self._stats["misses"] += 1
+                return False, None
+
+            self._stats["hits"] += 1
+            self._stats["disk_hits"] += 1
+            self._store(key, payload, expires_at)
+            return True, json.loads(payload)
+
+    def set(self, key, value, ttl=None):
+        ttl = self.default_ttl if ttl is None else ttl
+        if ttl <= 0:
+            return
+        payload = json.dumps(value, separators=(",", ":"))
+        expires_at = time.time() + ttl
+        with self._lock:
+            self._stats["sets"] += 1
+            self._store(key, payload, expires_at)
+            self._disk_set(key, payload, expires_at)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            if self._db is not None:
+                self._db.execute("DELETE FROM cache WHERE namespace = ?", (self.name,))
+                self._disk_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hit_rate": self._stats["hits"] / lookups if lookups else 0.0,
+            }
+
+    # --- Memory tier (caller holds the lock) ---
+    def _store(self, key, payload, expires_at):
+        size = len(payload.encode("utf-8"))
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._drop(key)
+        self._entries[key] = (expires_at, size, payload)
+        self._bytes += size
+        while self._entries and (
+            len(self._entries) > self.max_entries
+            or (self.max_bytes is not None and self._bytes > self.max_bytes)
+        ):
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+            self._stats["evictions"] += 1
+
+    def _drop(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    # --- Disk tier (caller holds the lock) ---
+    def _disk_get(self, key, now):
+        if self._db is None:
+            return None, None
+        row = self._db.execute(
+            "SELECT payload, expires_at, size FROM cache WHERE namespace = ? AND key = ?", (self.name, key)
+        ).fetchone()
+        if row is None:
+            return None, None
+        payload, expires_at, size = row
+        if expires_at <= now:
+            self._disk_delete(key, size)
+            self._stats["expirations"] += 1
+            return None, None
+        self._db.execute(
+            "UPDATE cache SET accessed_at = ? WHERE namespace = ? AND key = ?", (now, self.name, key)
+        )
+        return payload, expires_at
+
+    def _disk_set(self, key, payload, expires_at):
+        if self._db is None:
+            return
+        now = time.time()
+        size = len(payload.encode("utf-8"))
+        old = self._db.execute(
+            "SELECT size FROM cache WHERE namespace = ? AND key = ?", (self.name, key)
+        ).fetchone()
+        self._db.execute(
+            "INSERT OR REPLACE INTO cache (namespace, key, payload, expires_at, size, accessed_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (self.name, key, payload, expires_at, size, now),
+        )
+        self._disk_bytes += size - (old[0] if old else 0)
+        if self.max_disk_bytes is None or self._disk_bytes <= self.max_disk_bytes:
+            return
+        # Over budget: expired rows go first, then the least recently used
+        expired = self._db.execute(
+            "SELECT key, size FROM cache WHERE namespace = ? AND expires_at <= ?", (self.name, now)
+        ).fetchall()
+        for old_key, old_size in expired:
+            self._disk_delete(old_key, old_size)
+        if self._disk_bytes <= self.max_disk_bytes:
+            return
+        rows = self._db.execute(
+            "SELECT key, size FROM cache WHERE namespace = ? ORDER BY accessed_at ASC", (self.name,)
+        ).fetchall()
+        for old_key, old_size in rows:
+            if self._disk_bytes <= self.max_disk_bytes:
+                break
+            self._disk_delete(old_key, old_size)
+            self._stats["evictions"] += 1
+
+    def _disk_delete(self, key, size):
+        self._db.execute("DELETE FROM cache WHERE namespace = ? AND key = ?", (self.name, key))
+        self._disk_bytes -= size
+
+
+# --- SEARCH RESULT CACHE ---
+# TTL per provider, in seconds (0 disables caching for that provider)
+SEARCH_CACHE_TTLS = {
+    "serpapi": int(os.getenv("SEARCH_CACHE_TTL_SERPAPI", "3600")),
+    "duckduckgo": int(os.getenv("SEARCH_CACHE_TTL_DUCKDUCKGO", "1800")),
+    "reddit": int(os.getenv("SEARCH_CACHE_TTL_REDDIT", "3600")),
+}
+
+search_cache = TTLCache(
+    "search",
+    max_entries=int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "512")),
+    max_bytes=int(os.getenv("SEARCH_CACHE_MAX_BYTES", "16777216")),
+    sqlite_path=os.getenv("SEARCH_CACHE_PATH") or None,
+    max_disk_bytes=int(os.getenv("SEARCH_CACHE_MAX_DISK_BYTES", "268435456")),
+)
+
+register_stats("cache", "cache", "search", search_cache.stats)
+
+def search_cache_key(engine, query, num):
+    normalized = " ".join(str(query).lower().split())
+    return json.dumps([engine, normalized, num])
@@ -0,0 +1,49 @@
+import os
+import uuid
+import asyncio
+import sqlite3
+import functools
+
+# --- PERSISTENT CHECKPOINTS ---
+# Every graph run is checkpointed to SQLite after each step, keyed by its run
+# id (LangGraph's thread_id). A crashed run can resume from the last completed
+# node and a finished run can be re-synthesized from its saved upstream outputs.
+
+CHECKPOINT_DB = os.getenv("CHECKPOINT_DB", "checkpoints.sqlite")
+
+@functools.cache
+def threaded_sqlite_saver():
+    # Built on first use so importing this module doesn't pull in LangGraph
+    from langgraph.checkpoint.sqlite import SqliteSaver
+
+    class ThreadedSqliteSaver(SqliteSaver):
+        # SqliteSaver only implements the sync API; graph.astream needs the async
+        # one too, so those calls are pushed onto a worker thread.
+        async def aget_tuple(self, config):
+            return await asyncio.to_thread(self.get_tuple, config)
+
+        async def alist(self, config, *, filter=None, before=None, limit=None):
+            items = await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+            for item in items:
+                yield item
+
+        async def aput(self, config, checkpoint, metadata, new_versions):
+            return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+        async def aput_writes(self, config, writes, task_id, task_path=""):
+            return await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+        async def adelete_thread(self, thread_id):
+            return await asyncio.to_thread(self.delete_thread, thread_id)
+
+    return ThreadedSqliteSaver
+
+def make_checkpointer(path=CHECKPOINT_DB):
+    conn = sqlite3.connect(path, check_same_thread=False)
+    return threaded_sqlite_saver()(conn)
+
+def new_run_id():
+    return uuid.uuid4().hex
+
+def run_config(run_id=None):
+    return {"configurable": {"thread_id": run_id or new_run_id()}}
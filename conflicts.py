@@ -0,0 +1,239 @@
+import os
+import re
+from typing import List
+
+from pydantic import BaseModel, Field
+
+from context_packing import estimate_tokens, pack, dedupe
+from prompts import get_conflict_detection_messages, get_claim_extraction_messages, get_claim_adjudication_messages
+from ranking import cosine_matrix
+
+# --- CONFLICT DETECTION ---
+# "single": one ConflictReport call over the top Google results and the first
+# three Reddit threads (the original behaviour).
+# "map_reduce": all the evidence is split into token-sized chunks, each chunk
+# gets its own ConflictReport call (in parallel, bounded), and the partial
+# reports are merged and de-duplicated. Latency stays close to one call as
+# long as the number of chunks is within CONFLICT_MAX_CONCURRENCY.
+# "claims": every source is broken into atomic claims, Google/Reddit claim
+# pairs are pre-matched locally by TF-IDF cosine similarity, and only the top
+# pairs go to Gemini for adjudication. Every finding names its sources.
+
+CONFLICT_MODE = os.getenv("CONFLICT_MODE", "single")
+CONFLICT_CHUNK_TOKENS = int(os.getenv("CONFLICT_CHUNK_TOKENS", "1500"))  # per side, per chunk
+CONFLICT_MAX_CONCURRENCY = int(os.getenv("CONFLICT_MAX_CONCURRENCY", "4"))
+CONFLICT_MAX_CHUNKS = int(os.getenv("CONFLICT_MAX_CHUNKS", "8"))
+CLAIMS_PER_SOURCE = int(os.getenv("CLAIMS_PER_SOURCE", "8"))
+CLAIM_TOP_PAIRS = int(os.getenv("CLAIM_TOP_PAIRS", "12"))
+CLAIM_MIN_SIMILARITY = float(os.getenv("CLAIM_MIN_SIMILARITY", "0.15"))
+MAX_UNIQUE_INSIGHTS = 8
+
+class ConflictReport(BaseModel):
+    agreements: List[str] = Field(description="List of matching facts or opinions")
+    conflicts: List[str] = Field(description="List of contradictions or disagreements")
+    unique_google_insights: List[str] = Field(description="Information found only in Google results")
+    unique_reddit_insights: List[str] = Field(description="Information found only in Reddit results")
+    final_conflict_report: str = Field(description="A brief summary of the differences")
+
+class ClaimList(BaseModel):
+    claims: List[str] = Field(description="Atomic claims made by the source, one sentence each")
+
+class PairVerdict(BaseModel):
+    pair: int = Field(description="Number of the claim pair")
+    relation: str = Field(description="agree, conflict or unrelated")
+    note: str = Field(description="One sentence stating the shared point or the disagreement")
+
+class ClaimAdjudication(BaseModel):
+    verdicts: List[PairVerdict] = Field(description="One verdict per claim pair")
+    summary: str = Field(description="A brief summary of the differences")
+
+LIST_FIELDS = ["agreements", "conflicts", "unique_google_insights", "unique_reddit_insights"]
+
+def format_google(results):
+    return [f"- {r.get('title', '')}: {r.get('snippet', '')}" for r in results]
+
+def chunk_texts(texts, budget_tokens):
+    # Consecutive texts packed into chunks of at most budget_tokens each; a
+    # text that is too long on its own is truncated into a chunk of its own.
+    chunks, current, used = [], [], 0
+    for text in texts:
+        cost = estimate_tokens(text)
+        if current and used + cost > budget_tokens:
+            chunks.append(current)
+            current, used = [], 0
+        if cost > budget_tokens:
+            chunks.append(pack([text], budget_tokens)[0])
+            continue
+        current.append(text)
+        used += cost
+    if current:
+        chunks.append(current)
+    return chunks
+
+def conflict_chunks(google_results, reddit_posts, budget_tokens=CONFLICT_CHUNK_TOKENS, max_chunks=CONFLICT_MAX_CHUNKS):
+    # Pairs Google and Reddit chunks round-robin so every chunk has both sides
+    # to compare; the shorter side's chunks are reused.
+    google_chunks = chunk_texts(format_google(google_results), budget_tokens)
+    reddit_chunks = chunk_texts(reddit_posts, budget_tokens)
+    if not google_chunks or not reddit_chunks:
+        return []
+    count = min(max(len(google_chunks), len(reddit_chunks)), max_chunks)
+    return [
+        ("\n".join(google_chunks[i % len(google_chunks)]), "\n".join(reddit_chunks[i % len(reddit_chunks)]))
+        for i in range(count)
+    ]
+
+def merge_reports(reports):
+    # Near-identical statements from different chunks are kept once
+    merged = {}
+    for field in LIST_FIELDS:
+        items = [item for report in reports for item in report.get(field, []) if item]
+        merged[field], _ = dedupe(items, lambda item: item)
+    summaries, _ = dedupe([r.get("final_conflict_report", "") for r in reports if r.get("final_conflict_report")], lambda s: s)
+    merged["final_conflict_report"] = " ".join(summaries)
+    return merged
+
+def detect_conflicts(llm, google_results, reddit_posts, mode=None, max_concurrency=CONFLICT_MAX_CONCURRENCY):
+    # Returns a ConflictReport as a dict ({} when one side has no evidence)
+    if not google_results or not reddit_posts:
+        return {}
+    mode = mode or CONFLICT_MODE
+    if mode == "claims":
+        return detect_claim_conflicts(llm, google_results, reddit_posts, max_concurrency)
+    structured_llm = llm.with_structured_output(ConflictReport)
+
+    if mode != "map_reduce":
+        google_text = "\n".join(format_google(google_results))
+        reddit_text = "\n".join(reddit_posts[:3])  # Limit to top 3 threads to save tokens
+        response = structured_llm.invoke(get_conflict_detection_messages(google_text, reddit_text))
+        return response.model_dump()
+
+    chunks = conflict_chunks(google_results, reddit_posts)
+    print(f"--- [Conflicts] Map-reduce over {len(chunks)} chunks ---")
+    responses = structured_llm.batch(
+        [get_conflict_detection_messages(g, r) for g, r in chunks],
+        config={"max_concurrency": max_concurrency},
+        return_exceptions=True,
+    )
+    reports = [r.model_dump() for r in responses if isinstance(r, BaseModel)]
+    errors = [r for r in responses if isinstance(r, Exception)]
+    if not reports:
+        # Every chunk failed: surface the first error like the single-call path
+        if errors:
+            raise errors[0]
+        return {}
+    if len(reports) < len(responses):
+        print(f"--- [Conflicts] {len(responses) - len(reports)} of {len(responses)} chunks failed ---")
+    return merge_reports(reports)
+
+# --- Claim-level engine ---
+# Sentence ends, line breaks and the " | " between scraped Reddit comments
+_SENTENCE_RE = re.compile(r"\s+\|\s+|(?<=[.!?])\s+|\n+")
+_FIELD_PREFIX_RE = re.compile(r"^(Title|Post|Comments):\s*")
+
+def split_sentences(text, min_words=5):
+    sentences = (_FIELD_PREFIX_RE.sub("", s.strip()) for s in _SENTENCE_RE.split(text or ""))
+    return [s for s in sentences if len(s.split()) >= min_words]
+
+def source_documents(google_results, reddit_posts):
+    docs = []
+    for i, r in enumerate(google_results, 1):
+        docs.append({
+            "side": "google", "source": f"google:{i}",
+            "label": f"{r.get('title', '')} ({r.get('link', '')})",
+            "text": f"{r.get('title', '')}. {r.get('snippet', '')}",
+        })
+    for i, post in enumerate(reddit_posts, 1):
+        title = post.split("\n", 1)[0].removeprefix("Title: ")
+        docs.append({"side": "reddit", "source": f"reddit:{i}", "label": title, "text": post})
+    return docs
+
+def extract_claims(llm, docs, max_concurrency=CONFLICT_MAX_CONCURRENCY):
+    # Google snippets are already one or two sentences, so they are split
+    # locally; only the long Reddit threads go through the extractor.
+    threads = [d for d in docs if d["side"] == "reddit"]
+    extracted = {}
+    if threads:
+        structured_llm = llm.with_structured_output(ClaimList)
+        responses = structured_llm.batch(
+            [get_claim_extraction_messages(d["label"], pack([d["text"]], CONFLICT_CHUNK_TOKENS)[0][0]) for d in threads],
+            config={"max_concurrency": max_concurrency},
+            return_exceptions=True,
+        )
+        for doc, response in zip(threads, responses):
+            if isinstance(response, ClaimList):
+                extracted[doc["source"]] = response.claims
+            else:
+                print(f"--- [Conflicts] Claim extraction failed for {doc['source']} ({response}), splitting locally ---")
+
+    claims = []
+    for doc in docs:
+        texts = extracted.get(doc["source"]) or split_sentences(doc["text"])
+        for text in texts[:CLAIMS_PER_SOURCE]:
+            claims.append({"source": doc["source"], "side": doc["side"], "text": text})
+    return claims
+
+def candidate_pairs(google_claims, reddit_claims, top_k=CLAIM_TOP_PAIRS, min_similarity=CLAIM_MIN_SIMILARITY, use_numpy=None):
+    # Highest-similarity (score, google index, reddit index) pairs; a claim
+    # joins at most two pairs so a single popular claim can't take them all
+    scores = cosine_matrix([c["text"] for c in google_claims], [c["text"] for c in reddit_claims], use_numpy=use_numpy)
+    ranked = sorted(
+        ((score, i, j) for i, row in enumerate(scores) for j, score in enumerate(row) if score >= min_similarity),
+        key=lambda p: -p[0],
+    )
+    pairs, uses = [], {}
+    for score, i, j in ranked:
+        if uses.get(("g", i), 0) >= 2 or uses.get(("r", j), 0) >= 2:
+            continue
+        pairs.append((score, i, j))
+        uses[("g", i)] = uses.get(("g", i), 0) + 1
+        uses[("r", j)] = uses.get(("r", j), 0) + 1
+        if len(pairs) >= top_k:
+            break
+    return pairs
+
+def detect_claim_conflicts(llm, google_results, reddit_posts, max_concurrency=CONFLICT_MAX_CONCURRENCY):
+    docs = source_documents(google_results, reddit_posts)
+    claims = extract_claims(llm, docs, max_concurrency)
+    google_claims = [c for c in claims if c["side"] == "google"]
+    reddit_claims = [c for c in claims if c["side"] == "reddit"]
+    pairs = candidate_pairs(google_claims, reddit_claims)
+    print(f"--- [Conflicts] {len(google_claims)} Google / {len(reddit_claims)} Reddit claims, {len(pairs)} pairs to adjudicate ---")
+
+    verdicts, summary = {}, ""
+    if pairs:
+        pair_text = "\n".join(
+            f"{n}. Google ({google_claims[i]['source']}): {google_claims[i]['text']}\n"
+            f"   Reddit ({reddit_claims[j]['source']}): {reddit_claims[j]['text']}"
+            for n, (_, i, j) in enumerate(pairs, 1)
+        )
+        adjudication = llm.with_structured_output(ClaimAdjudication).invoke(get_claim_adjudication_messages(pair_text))
+        verdicts = {v.pair: v for v in adjudication.verdicts}
+        summary = adjudication.summary
+
+    report = {field: [] for field in LIST_FIELDS}
+    claim_pairs, matched = [], set()
+    for n, (score, i, j) in enumerate(pairs, 1):
+        g, r = google_claims[i], reddit_claims[j]
+        verdict = verdicts.get(n)
+        relation = verdict.relation.strip().lower() if verdict else "unrelated"
+        note = verdict.note if verdict else ""
+        claim_pairs.append({
+            "google_claim": g["text"], "google_source": g["source"],
+            "reddit_claim": r["text"], "reddit_source": r["source"],
+            "similarity": round(score, 3), "relation": relation, "note": note,
+        })
+        if relation in ("agree", "conflict"):
+            field = "agreements" if relation == "agree" else "conflicts"
+            report[field].append(f"{note or g['text']} [{g['source']} vs {r['source']}]")
+            matched.update({("google", i), ("reddit", j)})
+
+    # Claims with no counterpart on the other side
+    for side, side_claims in (("google", google_claims), ("reddit", reddit_claims)):
+        unique = [f"{c['text']} [{c['source']}]" for k, c in enumerate(side_claims) if (side, k) not in matched]
+        report[f"unique_{side}_insights"] = unique[:MAX_UNIQUE_INSIGHTS]
+
+    report["final_conflict_report"] = summary or "No overlapping claims were found between Google and Reddit."
+    report["claim_pairs"] = claim_pairs
+    report["sources"] = {d["source"]: d["label"] for d in docs}
+    return report
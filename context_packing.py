@@ -0,0 +1,131 @@
+import os
+import re
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+from ranking import bm25_scores
+
+# --- CONTEXT PACKING ---
+# Before any analysis prompt is built, search hits from every source are
+# de-duplicated (same canonical URL, or near-identical text by Jaccard
+# similarity of word shingles), ranked against the question and packed into
+# a token budget.
+
+WEB_CONTEXT_TOKENS = int(os.getenv("WEB_CONTEXT_TOKENS", "1200"))  # per source
+REDDIT_CONTEXT_TOKENS = int(os.getenv("REDDIT_CONTEXT_TOKENS", "3000"))
+DEDUP_SIMILARITY = float(os.getenv("DEDUP_SIMILARITY", "0.7"))
+
+_TRACKING_PARAMS = {"fbclid", "gclid", "msclkid", "ref", "ref_src", "source", "igshid"}
+_WORD_RE = re.compile(r"\w+")
+
+def estimate_tokens(text):
+    # Rough but stable: ~4 characters per token for English text
+    return len(text) // 4 + 1
+
+def canonical_url(url):
+    if not url:
+        return ""
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    if host.startswith("old.") or host.startswith("m."):
+        host = host.split(".", 1)[1]
+    query = [(k, v) for k, v in parse_qsl(parts.query) if not k.startswith("utm_") and k not in _TRACKING_PARAMS]
+    path = parts.path.rstrip("/") or "/"
+    # http/https and fragments never change the document
+    return urlunsplit(("", host, path, urlencode(sorted(query)), ""))
+
+# --- Shingle similarity ---
+# Hits per request are in the tens, so exact Jaccard over hashed word
+# shingles is cheaper than building MinHash signatures and has no estimation error.
+def shingles(text, k=3):
+    words = _WORD_RE.findall((text or "").lower())
+    if len(words) <= k:
+        return {hash(" ".join(words))} if words else set()
+    return {hash(" ".join(words[i:i + k])) for i in range(len(words) - k + 1)}
+
+def similarity(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+def result_text(result):
+    text = f"Title: {result.get('title') or ''}\nSnippet: {result.get('snippet') or ''}"
+    if result.get("page_excerpt"):
+        text += f"\nPage: {result['page_excerpt']}"
+    return text
+
+def _dedup_text(result):
+    # Engines rewrite titles, so compare on the snippet when there is one
+    snippet = result.get("snippet") or ""
+    return snippet if len(snippet.split()) >= 8 else result_text(result)
+
+def dedupe(items, text_of, url_of=None, threshold=DEDUP_SIMILARITY):
+    # Keeps the first occurrence, so pass items in source-priority order.
+    kept, signatures, seen_urls = [], [], set()
+    removed = 0
+    for item in items:
+        url = canonical_url(url_of(item)) if url_of else ""
+        if url and url in seen_urls:
+            removed += 1
+            continue
+        signature = shingles(text_of(item))
+        if any(similarity(signature, other) >= threshold for other in signatures):
+            removed += 1
+            continue
+        if url:
+            seen_urls.add(url)
+        kept.append(item)
+        signatures.append(signature)
+    return kept, removed
+
+def rank(question, items, text_of):
+    # BM25 relevance, with the provider's own ordering as a tie-breaker
+    scores = bm25_scores(question, [text_of(item) for item in items])
+    order = sorted(range(len(items)), key=lambda i: (-scores[i], i))
+    return [items[i] for i in order]
+
+def pack(texts, budget_tokens, min_tail_tokens=50):
+    # Greedy: whole texts while they fit, then a truncated tail if worthwhile
+    packed, used = [], 0
+    for text in texts:
+        cost = estimate_tokens(text)
+        if used + cost <= budget_tokens:
+            packed.append(text)
+            used += cost
+            continue
+        remaining = budget_tokens - used
+        if remaining >= min_tail_tokens:
+            packed.append(text[: remaining * 4].rstrip() + " ...")
+            used = budget_tokens
+        break
+    return packed, used
+
+def pack_web_results(question, sources, budget_tokens=WEB_CONTEXT_TOKENS, enrich=None):
+    # sources: ordered mapping of source name -> result list. Duplicates are
+    # dropped across all sources; each source is packed into its own budget.
+    # enrich (optional) maps the surviving results to copies with extra
+    # fields, e.g. page_fetch.enrich_results, so no page is fetched twice.
+    tagged = [(name, r) for name, results in sources.items() for r in (results or [])]
+    kept, removed = dedupe(tagged, lambda t: _dedup_text(t[1]), lambda t: t[1].get("link"))
+
+    contexts, stats = {}, {"input_items": len(tagged), "duplicates_removed": removed}
+    if enrich is not None:
+        kept = list(zip([name for name, _ in kept], enrich([r for _, r in kept])))
+        stats["pages_enriched"] = sum(1 for _, r in kept if r.get("page_excerpt"))
+    for name in sources:
+        texts = [result_text(r) for source, r in kept if source == name]
+        ranked = rank(question, texts, lambda t: t)
+        packed, used = pack(ranked, budget_tokens)
+        contexts[name] = "\n".join(packed)
+        stats[f"{name}_input_items"] = sum(1 for source, _ in tagged if source == name)
+        stats[f"{name}_unique_items"] = len(texts)
+        stats[f"{name}_items"] = len(packed)
+        stats[f"{name}_tokens"] = used
+    return contexts, stats
+
+def pack_posts(question, posts, budget_tokens=REDDIT_CONTEXT_TOKENS):
+    kept, removed = dedupe(posts, lambda p: p)
+    ranked = rank(question, kept, lambda p: p)
+    packed, used = pack(ranked, budget_tokens)
+    return packed, {"input_items": len(posts), "duplicates_removed": removed, "packed_items": len(packed), "tokens": used}
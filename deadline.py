@@ -0,0 +1,70 @@
+import os
+import time
+import functools
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+# --- LATENCY BUDGET ---
+# A run gets `latency_budget` seconds from `started_at`. Each stage may use the
+# budget up to its share, e.g. every search/scrape/analysis branch must be done
+# by 60% of the budget, so conflict detection and synthesis still have time to
+# work with whatever arrived. Nodes that overrun are abandoned: the graph moves
+# on with the node's fallback output and the source is listed as missing.
+
+DEFAULT_LATENCY_BUDGET = float(os.getenv("LATENCY_BUDGET", "0"))  # 0 = unlimited
+
+STAGE_SHARES = {
+    "branch": float(os.getenv("LATENCY_SHARE_BRANCH", "0.6")),
+    "conflict": float(os.getenv("LATENCY_SHARE_CONFLICT", "0.8")),
+    "synthesis": 1.0,
+}
+
+# Abandoned calls keep running here until their own timeouts fire
+_executor = ThreadPoolExecutor(max_workers=int(os.getenv("DEADLINE_WORKERS", "32")), thread_name_prefix="deadline")
+
+def stage_deadline(state, stage):
+    budget = state.get("latency_budget") or 0
+    started_at = state.get("started_at")
+    if budget <= 0 or started_at is None:
+        return None
+    return started_at + budget * STAGE_SHARES[stage]
+
+def time_left(state, stage):
+    deadline_at = stage_deadline(state, stage)
+    if deadline_at is None:
+        return None
+    return deadline_at - time.time()
+
+def with_deadline(source, stage, fallback):
+    # `fallback` is the node output used when the source is cut, or a
+    # function building it from the state
+    def make_fallback(state):
+        return fallback(state) if callable(fallback) else dict(fallback)
+
+    def decorator(node):
+        @functools.wraps(node)
+        def run(state):
+            if source in state.get("missing_sources", []):
+                # An upstream node of this branch was already cut
+                return make_fallback(state)
+
+            remaining = time_left(state, stage)
+            if remaining is None:
+                return node(state)
+            if remaining <= 0:
+                print(f"--- [Deadline] {node.__name__} skipped: {source} budget exhausted ---")
+                return {**make_fallback(state), "missing_sources": [source]}
+
+            # Context is copied so graph streaming callbacks still reach the node
+            ctx = contextvars.copy_context()
+            future = _executor.submit(ctx.run, node, state)
+            try:
+                return future.result(timeout=remaining)
+            except FutureTimeout:
+                future.cancel()
+                print(f"--- [Deadline] {node.__name__} cut after {remaining:.1f}s: {source} marked missing ---")
+                return {**make_fallback(state), "missing_sources": [source]}
+        # Lets batch.py put the same cut-off on its own version of the node
+        run.deadline = (source, stage, fallback)
+        return run
+    return decorator
@@ -0,0 +1,101 @@
+import os
+import asyncio
+import threading
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from metrics import register_stats
+
+# --- BOUNDED PROVIDER POOLS ---
+# Blocking provider calls (SerpApi, DDGS, requests, Gemini) run on a dedicated
+# thread pool per provider so they never stall the event loop. Each pool also
+# caps how many calls may wait for a worker; past that, callers get
+# PoolSaturated right away instead of queueing without limit.
+
+class PoolSaturated(Exception):
+    pass
+
+
+class ProviderPool:
+    def __init__(self, name, max_workers, max_queue):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{name}-pool")
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._stats = {"submitted": 0, "completed": 0, "failed": 0, "rejected": 0}
+
+    async def run(self, fn, *args, **kwargs):
+        with self._lock:
+            if self._in_flight >= self.max_workers + self.max_queue:
+                self._stats["rejected"] += 1
+                raise PoolSaturated(f"{self.name} pool is saturated ({self._in_flight} calls in flight)")
+            self._in_flight += 1
+            self._stats["submitted"] += 1
+
+        # Carry context variables (tracing, deadlines) into the worker thread
+        ctx = contextvars.copy_context()
+        call = functools.partial(ctx.run, fn, *args, **kwargs)
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(self._executor, call)
+        except Exception:
+            with self._lock:
+                self._stats["failed"] += 1
+            raise
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+        with self._lock:
+            self._stats["completed"] += 1
+        return result
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self._stats,
+                "in_flight": self._in_flight,
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+            }
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+
+def _make_pool(name, workers, queue):
+    env = name.upper()
+    return ProviderPool(
+        name,
+        max_workers=int(os.getenv(f"POOL_{env}_WORKERS", str(workers))),
+        max_queue=int(os.getenv(f"POOL_{env}_QUEUE", str(queue))),
+    )
+
+provider_pools = {
+    "serpapi": _make_pool("serpapi", 8, 32),
+    "duckduckgo": _make_pool("duckduckgo", 4, 16),
+    "reddit": _make_pool("reddit", 8, 32),
+    "gemini": _make_pool("gemini", 8, 32),
+    # Whole graph runs (resume / re-synthesis) started from the API
+    "graph": _make_pool("graph", 4, 16),
+}
+
+for _name, _pool in provider_pools.items():
+    register_stats("pool", "pool", _name, _pool.stats)
+
+
+# --- PER-HOST LIMITS ---
+# Scrapers cap how many requests a single host gets at once. Each caller
+# names its group, so Reddit threads and fetched pages keep separate limits
+# even when they share a host.
+_host_semaphores = {}
+_host_semaphores_lock = threading.Lock()
+
+def host_semaphore(group, url, limit):
+    key = (group, urlsplit(url).netloc.lower())
+    with _host_semaphores_lock:
+        if key not in _host_semaphores:
+            _host_semaphores[key] = threading.BoundedSemaphore(limit)
+        return _host_semaphores[key]
@@ -0,0 +1,206 @@
+import os
+import time
+import uuid
+import heapq
+import threading
+
+from metrics import register_stats
+
+# --- BACKGROUND JOBS ---
+# Research runs that outlive an HTTP request are submitted as jobs. A fixed
+# number of worker threads take jobs from an in-process priority queue:
+# higher priority first, and within a priority clients are served
+# round-robin (start-time fair queueing), so one client's burst cannot
+# starve everyone else. Finished jobs are kept for JOB_RESULT_TTL seconds.
+
+QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED = "queued", "running", "succeeded", "failed", "cancelled"
+FINISHED = {SUCCEEDED, FAILED, CANCELLED}
+
+class JobQueueFull(Exception):
+    pass
+
+class ClientLimitExceeded(Exception):
+    pass
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, fn, args, kwargs, client, priority, metadata=None):
+        self.id = uuid.uuid4().hex
+        self.client = client
+        self.priority = priority
+        self.metadata = metadata or {}
+        self.state = QUEUED
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.progress = []
+        self.result = None
+        self.error = None
+        self._fn, self._args, self._kwargs = fn, args, kwargs
+        self._cancel = threading.Event()
+        self._key = None  # heap ordering key while queued
+
+    @property
+    def cancel_requested(self):
+        return self._cancel.is_set()
+
+    def check_cancelled(self):
+        # Called by the job function between steps; running jobs stop cooperatively
+        if self._cancel.is_set():
+            raise JobCancelled(f"job {self.id} was cancelled")
+
+    def to_dict(self):
+        return {
+            **self.metadata,
+            "job_id": self.id,
+            "client": self.client,
+            "priority": self.priority,
+            "status": self.state,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "progress": list(self.progress),
+            "error": self.error,
+        }
+
+
+class JobScheduler:
+    def __init__(self, name, workers, max_queued, max_per_client, result_ttl):
+        self.name = name
+        self.workers = workers
+        self.max_queued = max_queued
+        self.max_per_client = max_per_client
+        self.result_ttl = result_ttl
+        self._lock = threading.Condition()
+        self._heap = []
+        self._jobs = {}
+        self._seq = 0
+        self._virtual_time = 0.0  # start tag of the job dispatched last
+        self._client_tags = {}  # client -> start tag of its newest job
+        self._threads = []
+        self._stats = {"submitted": 0, "rejected": 0, "succeeded": 0, "failed": 0, "cancelled": 0, "evicted": 0}
+
+    def submit(self, fn, *args, client="anonymous", priority=0, metadata=None, **kwargs):
+        # fn(job, *args, **kwargs) runs on a worker thread
+        job = Job(fn, args, kwargs, client, priority, metadata)
+        with self._lock:
+            self._evict_expired()
+            queued = sum(1 for j in self._jobs.values() if j.state == QUEUED)
+            if queued >= self.max_queued:
+                self._stats["rejected"] += 1
+                raise JobQueueFull(f"{self.name} queue is full ({queued} jobs waiting)")
+            active = sum(1 for j in self._jobs.values() if j.client == client and j.state in (QUEUED, RUNNING))
+            if active >= self.max_per_client:
+                self._stats["rejected"] += 1
+                raise ClientLimitExceeded(f"client {client} already has {active} active jobs")
+
+            # A client's jobs are tagged one after another; an idle client
+            # starts at the current virtual time, so it goes next.
+            tag = max(self._virtual_time, self._client_tags.get(client, 0.0)) + 1
+            self._client_tags[client] = tag
+            self._seq += 1
+            job._key = (-priority, tag, self._seq)
+            heapq.heappush(self._heap, (*job._key, job))
+            self._jobs[job.id] = job
+            self._stats["submitted"] += 1
+            self._start_workers()
+            self._lock.notify()
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            self._evict_expired()
+            return self._jobs.get(job_id)
+
+    def position(self, job):
+        # 1-based place in the queue, None once the job has started
+        with self._lock:
+            if job.state != QUEUED:
+                return None
+            return 1 + sum(1 for *key, other in self._heap if other.state == QUEUED and tuple(key) < job._key)
+
+    def cancel(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.state in FINISHED:
+                return job
+            job._cancel.set()
+            if job.state == QUEUED:
+                # Left in the heap; workers skip it
+                self._finish(job, CANCELLED)
+            return job
+
+    def stats(self):
+        with self._lock:
+            states = [j.state for j in self._jobs.values()]
+            return {
+                **self._stats,
+                "queued": states.count(QUEUED),
+                "running": states.count(RUNNING),
+                "retained": len(states),
+                "workers": self.workers,
+            }
+
+    def _start_workers(self):
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._worker, name=f"{self.name}-worker-{len(self._threads)}", daemon=True)
+            self._threads.append(thread)
+            thread.start()
+
+    def _next_job(self):
+        with self._lock:
+            while True:
+                while self._heap:
+                    _, tag, _, job = heapq.heappop(self._heap)
+                    if job.state == QUEUED:
+                        self._virtual_time = tag
+                        job.state = RUNNING
+                        job.started_at = time.time()
+                        return job
+                self._lock.wait()
+
+    def _worker(self):
+        while True:
+            job = self._next_job()
+            try:
+                result = job._fn(job, *job._args, **job._kwargs)
+            except JobCancelled:
+                with self._lock:
+                    self._finish(job, CANCELLED)
+            except Exception as e:
+                print(f"--- [Jobs] {job.id} failed: {e} ---")
+                with self._lock:
+                    job.error = str(e)
+                    self._finish(job, FAILED)
+            else:
+                with self._lock:
+                    job.result = result
+                    self._finish(job, SUCCEEDED)
+
+    def _finish(self, job, state):
+        job.state = state
+        job.finished_at = time.time()
+        job._fn = job._args = job._kwargs = None
+        self._stats[state] += 1
+
+    def _evict_expired(self):
+        now = time.time()
+        expired = [j.id for j in self._jobs.values() if j.state in FINISHED and now - j.finished_at > self.result_ttl]
+        for job_id in expired:
+            del self._jobs[job_id]
+        self._stats["evicted"] += len(expired)
+        # Tags at or behind the virtual clock no longer affect ordering
+        self._client_tags = {c: t for c, t in self._client_tags.items() if t > self._virtual_time}
+
+
+research_jobs = JobScheduler(
+    "research",
+    workers=int(os.getenv("JOB_WORKERS", "2")),
+    max_queued=int(os.getenv("JOB_MAX_QUEUED", "100")),
+    max_per_client=int(os.getenv("JOB_MAX_PER_CLIENT", "10")),
+    result_ttl=int(os.getenv("JOB_RESULT_TTL", "3600")),
+)
+register_stats("jobs", "scheduler", "research", research_jobs.stats)
@@ -0,0 +1,205 @@
+import os
+import json
+import hashlib
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.messages import AIMessage, AIMessageChunk, convert_to_messages
+
+from cache import TTLCache
+from metrics import register_stats, record_llm_call
+from ratelimit import rate_limiters
+from singleflight import flights
+
+# --- LLM RESPONSE CACHE ---
+llm_cache = TTLCache(
+    "llm",
+    max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1024")),
+    max_bytes=int(os.getenv("LLM_CACHE_MAX_BYTES", "33554432")),
+    default_ttl=int(os.getenv("LLM_CACHE_TTL", "86400")),
+    sqlite_path=os.getenv("LLM_CACHE_PATH") or None,
+    max_disk_bytes=int(os.getenv("LLM_CACHE_MAX_DISK_BYTES", "536870912")),
+)
+register_stats("cache", "cache", "llm", llm_cache.stats)
+
+def _serialize_input(model_input):
+    if isinstance(model_input, str):
+        return model_input
+    return [{"type": m.type, "content": m.content} for m in convert_to_messages(model_input)]
+
+def _schema_fingerprint(schema):
+    if hasattr(schema, "model_json_schema"):
+        return schema.model_json_schema()
+    if isinstance(schema, dict):
+        return schema
+    return getattr(schema, "__qualname__", repr(schema))
+
+def llm_cache_key(model, output, model_input, options=None):
+    # Exact-match key: identical prompts (byte for byte), output shape and call
+    # options (stop, tools, ...; sorted by name) share an entry
+    key = {"model": model, "output": output, "input": _serialize_input(model_input)}
+    if options:
+        key["options"] = options
+    raw = json.dumps(key, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _estimate_tokens(model_input):
+    # Input tokens (~4 characters each) plus a typical answer; settled against real usage afterwards
+    return len(json.dumps(_serialize_input(model_input), default=str)) // 4 + 500
+
+def _limited_call(limiter, call, model_input):
+    # Reserve one request and the estimated tokens, then correct the token bucket
+    if limiter is None or not limiter.enabled:
+        return call()
+    estimate = _estimate_tokens(model_input)
+    limiter.acquire(tokens=estimate)
+    response = call()
+    raw = response.get("raw") if isinstance(response, dict) else response
+    usage = getattr(raw, "usage_metadata", None)
+    limiter.settle(estimate, usage.get("total_tokens") if usage else None)
+    return response
+
+def _batch(invoke, inputs, config=None, return_exceptions=False):
+    # Like Runnable.batch, but every item goes through the cached invoke();
+    # config["max_concurrency"] bounds the number of calls in flight.
+    inputs = list(inputs)
+    if not inputs:
+        return []
+    config = dict(config or {})
+    workers = config.pop("max_concurrency", None) or len(inputs)
+
+    def call(item):
+        try:
+            return invoke(item, config=config or None)
+        except Exception as e:
+            if return_exceptions:
+                return e
+            raise
+
+    with ThreadPoolExecutor(max_workers=min(workers, len(inputs))) as executor:
+        futures = [executor.submit(contextvars.copy_context().run, call, item) for item in inputs]
+        return [future.result() for future in futures]
+
+
+class CachedChatModel:
+    # Drop-in wrapper around a chat model: invoke(), stream() and
+    # with_structured_output(...).invoke() are served from llm_cache when the
+    # prompt was seen before (batch() too), and identical prompts that are
+    # already in flight wait for that call. Everything else is forwarded to
+    # the wrapped model.
+    def __init__(self, llm, cache=None, ttl=None, limiter=None):
+        self._llm = llm
+        self._cache = llm_cache if cache is None else cache
+        self._ttl = ttl
+        # Cache hits never touch the rate limit, only calls that reach the model
+        self._limiter = rate_limiters["gemini"] if limiter is None else limiter
+
+    @property
+    def model_name(self):
+        return getattr(self._llm, "model", None) or getattr(self._llm, "model_name", None) or type(self._llm).__name__
+
+    def invoke(self, input, config=None, **kwargs):
+        key = llm_cache_key(self.model_name, "text", input, kwargs)
+        hit, cached = self._cache.get(key)
+        if hit:
+            record_llm_call(cache_hit=True)
+            return AIMessage(content=cached["content"], response_metadata={"cache_hit": True})
+
+        return flights["llm"].do(key, self._call, key, input, config, kwargs)
+
+    def _call(self, key, input, config, kwargs):
+        response = _limited_call(self._limiter, lambda: self._llm.invoke(input, config=config, **kwargs), input)
+        record_llm_call(cache_hit=False, usage=getattr(response, "usage_metadata", None))
+        self._cache.set(key, {"content": response.content}, ttl=self._ttl)
+        return response
+
+    def batch(self, inputs, config=None, *, return_exceptions=False):
+        return _batch(self.invoke, inputs, config, return_exceptions)
+
+    def stream(self, input, config=None, **kwargs):
+        # Yields AIMessageChunks as they arrive; a cache hit comes back as one
+        # chunk. Only a fully consumed stream is cached. Not coalesced: a
+        # follower would see no tokens until the leader had finished.
+        key = llm_cache_key(self.model_name, "text", input, kwargs)
+        hit, cached = self._cache.get(key)
+        if hit:
+            record_llm_call(cache_hit=True)
+            yield AIMessageChunk(content=cached["content"], response_metadata={"cache_hit": True})
+            return
+
+        limited = self._limiter is not None and self._limiter.enabled
+        estimate = _estimate_tokens(input)
+        if limited:
+            self._limiter.acquire(tokens=estimate)
+        full = None
+        for chunk in self._llm.stream(input, config=config, **kwargs):
+            full = chunk if full is None else full + chunk
+            yield chunk
+
+        usage = getattr(full, "usage_metadata", None)
+        if limited:
+            self._limiter.settle(estimate, usage.get("total_tokens") if usage else None)
+        record_llm_call(cache_hit=False, usage=usage)
+        if full is not None:
+            self._cache.set(key, {"content": full.content}, ttl=self._ttl)
+
+    def with_structured_output(self, schema, **kwargs):
+        # Ask for the raw message too (unless the caller did) so token usage can be recorded
+        unwrap = not kwargs.get("include_raw", False)
+        options = {name: value for name, value in kwargs.items() if name != "include_raw"}
+        kwargs["include_raw"] = True
+        return CachedStructuredOutput(self, schema, self._llm.with_structured_output(schema, **kwargs), unwrap, options)
+
+    def __getattr__(self, name):
+        return getattr(self._llm, name)
+
+
+class CachedStructuredOutput:
+    def __init__(self, parent, schema, runnable, unwrap=True, options=None):
+        self._parent = parent
+        self._schema = schema
+        self._runnable = runnable
+        self._unwrap = unwrap
+        self._options = options or {}  # with_structured_output() kwargs, e.g. method
+
+    def invoke(self, input, config=None, **kwargs):
+        key = llm_cache_key(self._parent.model_name, _schema_fingerprint(self._schema), input, {**self._options, **kwargs})
+        # Only parsed results are cached; include_raw callers need the real
+        # {"raw", "parsed", "parsing_error"} response, so they always call through
+        if not self._unwrap:
+            return flights["llm"].do((key, self._unwrap), self._call, key, input, config, kwargs)
+        hit, cached = self._parent._cache.get(key)
+        if hit:
+            record_llm_call(cache_hit=True)
+            return self._load(cached)
+        return flights["llm"].do((key, self._unwrap), self._call, key, input, config, kwargs)
+
+    def _call(self, key, input, config, kwargs):
+        response = _limited_call(self._parent._limiter, lambda: self._runnable.invoke(input, config=config, **kwargs), input)
+        raw = response.get("raw") if isinstance(response, dict) else None
+        record_llm_call(cache_hit=False, usage=getattr(raw, "usage_metadata", None))
+        if not self._unwrap:
+            return response
+        if response.get("parsing_error"):
+            raise response["parsing_error"]
+        response = response["parsed"]
+        if response is not None:
+            self._parent._cache.set(key, self._dump(response), ttl=self._parent._ttl)
+        return response
+
+    def batch(self, inputs, config=None, *, return_exceptions=False):
+        return _batch(self.invoke, inputs, config, return_exceptions)
+
+    def _dump(self, response):
+        if hasattr(response, "model_dump"):
+            return response.model_dump()
+        return response
+
+    def _load(self, data):
+        if hasattr(self._schema, "model_validate"):
+            return self._schema.model_validate(data)
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self._runnable, name)
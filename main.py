@@ -1,30 +1,95 @@
 import os
 from dotenv import load_dotenv
+import time
+import operator
+import functools
+import threading
 from typing import Annotated, List, TypedDict
-from langgraph.graph import StateGraph, START, END
-from langgraph.graph.message import add_messages
-from langchain_google_genai import ChatGoogleGenerativeAI
 from pydantic import BaseModel, Field
 
+load_dotenv()
+
 # Import our custom files
-from web_operations import serp_search, duckduckgo_search, reddit_search_api, reddit_post_retrieval
+from blobstore import with_blobs, state_blobs
+from checkpoints import make_checkpointer, run_config
+from conflicts import detect_conflicts
+from context_packing import pack_web_results, pack_posts
+from deadline import with_deadline, time_left, DEFAULT_LATENCY_BUDGET
+from llm_cache import CachedChatModel
+from page_fetch import enrich_results, PAGE_FETCH, PAGE_FETCH_DEADLINE
+from metrics import traced, trace_run
+from ranking import rank_results
+from resilience import provider_status
+from topology import node_dependencies, sinks
+from web_operations import serp_search, duckduckgo_search, reddit_search_api, reddit_post_retrieval, REDDIT_SCRAPE_DEADLINE
 from prompts import (
     get_google_analysis_messages,
     get_duckduckgo_analysis_messages,
     get_reddit_analysis_messages,
-    get_conflict_detection_messages,
     get_synthesis_messages
 )
 
-load_dotenv()
+# --- LAZY CONSTRUCTION ---
+# LangGraph and the Gemini SDK take seconds to import, so the LLM client and
+# the compiled graph are built on first use (get_llm() / get_graph(), or the
+# module attributes main.llm / main.graph) and then reused.
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+
+_llm = None
+_graph = None
+_init_lock = threading.Lock()
+
+def get_llm():
+    global _llm
+    if _llm is None:
+        with _init_lock:
+            if _llm is None:
+                from langchain_google_genai import ChatGoogleGenerativeAI
+                # Wrapped so byte-identical prompts are answered from the LLM response cache
+                _llm = CachedChatModel(ChatGoogleGenerativeAI(model=GEMINI_MODEL))
+    return _llm
+
+def get_graph():
+    global _graph
+    if _graph is None:
+        with _init_lock:
+            if _graph is None:
+                # Compile (checkpointed per run id, see checkpoints.py)
+                _graph = build_graph().compile(checkpointer=make_checkpointer())
+    return _graph
 
-# --- SETUP GEMINI ---
-llm = ChatGoogleGenerativeAI(model=	"gemini-2.5-flash")
+def __getattr__(name):
+    if name == "llm":
+        return get_llm()
+    if name == "graph":
+        return get_graph()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def _add_messages(left, right):
+    from langgraph.graph.message import add_messages
+    return add_messages(left, right)
+
+# --- STRUCTURED OUTPUTS ---
+class RedditURLSelection(BaseModel):
+    selected_urls: List[str] = Field(description="List of the best reddit URLs from the provided text")
 
 # --- DEFINE STATE ---
 class AgentState(TypedDict):
-    messages: Annotated[list, add_messages]
+    messages: Annotated[list, _add_messages]
     user_question: str
+    reddit_selector: str  # optional per-request override of REDDIT_SELECTOR
+    conflict_mode: str  # optional per-request override of CONFLICT_MODE
+    page_fetch: bool  # optional per-request override of PAGE_FETCH
+
+    # Latency budget (seconds, 0 = unlimited) and the sources it cut
+    latency_budget: float
+    started_at: float
+    missing_sources: Annotated[list, operator.add]
+    provider_status: dict  # circuit breaker state per provider at synthesis time
+
+    # Extra instructions for the synthesis prompt (lets a saved run be re-synthesized)
+    synthesis_instructions: str
+    synthesis_failed: bool
     
     # Raw Results (Lists)
     google_results: list
@@ -34,6 +99,12 @@ class AgentState(TypedDict):
     # Filtered/Scraped Data
     selected_reddit_urls: list[str]
     reddit_post_data: list
+
+    # De-duplicated, ranked and token-budgeted prompt context
+    google_context: str
+    duckduckgo_context: str
+    web_context_stats: dict
+    reddit_context_stats: dict
     
     # Analyses (Strings)
     google_analysis: str
@@ -44,123 +115,220 @@ class AgentState(TypedDict):
 
 # --- DEFINE NODES ---
 
+@with_deadline("google", "branch", {"google_results": []})
 def google_search_node(state: AgentState):
     query = state["user_question"]
     results = serp_search(query, engine="google")
     return {"google_results": results}
 
+@with_deadline("duckduckgo", "branch", {"duckduckgo_results": []})
 def duckduckgo_search_node(state: AgentState):
     query = state["user_question"]
     results = duckduckgo_search(query)
     return {"duckduckgo_results": results}
 
+@with_deadline("reddit", "branch", {"reddit_results": []})
 def reddit_search_node(state: AgentState):
     query = state["user_question"]
     results = reddit_search_api(query)
     return {"reddit_results": results}
 
-def select_reddit_urls_node(state: AgentState):
-    # print("--- [Node] Selecting Best Reddit Threads ---")
-    reddit_results = state.get("reddit_results", [])
-    if not reddit_results:
-        return {"selected_reddit_urls": []}
-        
+# "bm25": local ranking only, "llm": Gemini picks, "hybrid": BM25 with Gemini as tie-breaker
+REDDIT_SELECTOR = os.getenv("REDDIT_SELECTOR", "hybrid")
+REDDIT_THREADS = int(os.getenv("REDDIT_THREADS", "3"))
+
+def select_reddit_urls_llm(state: AgentState, reddit_results):
     # Format threads for Gemini to read
     context_str = "\n".join([f"{i}. {r['title']} ({r['link']})" for i, r in enumerate(reddit_results)])
     
-    # Define Structured Output
-    class RedditURLSelection(BaseModel):
-        selected_urls: List[str] = Field(description="List of 3 best reddit URLs from the provided text")
-
     prompt = f"""
     User Query: {state['user_question']}
     
     Reddit Threads Found:
     {context_str}
     
-    Select the top 3 URLs that are most likely to answer the query. Return ONLY the URLs.
+    Select the top {REDDIT_THREADS} URLs that are most likely to answer the query. Return ONLY the URLs.
     """
     
     try:
-        structured_llm = llm.with_structured_output(RedditURLSelection)
+        structured_llm = get_llm().with_structured_output(RedditURLSelection)
         response = structured_llm.invoke(prompt)
         return {"selected_reddit_urls": response.selected_urls}
     except Exception as e:
-        print(f"Selection Error: {e}, picking top 3 defaults.")
-        return {"selected_reddit_urls": [r['link'] for r in reddit_results[:3]]}
+        print(f"Selection Error: {e}, picking top {REDDIT_THREADS} defaults.")
+        return {"selected_reddit_urls": [r['link'] for r in reddit_results[:REDDIT_THREADS]]}
+
+@with_deadline("reddit", "branch", {"selected_reddit_urls": []})
+def select_reddit_urls_node(state: AgentState):
+    # print("--- [Node] Selecting Best Reddit Threads ---")
+    reddit_results = state.get("reddit_results", [])
+    if not reddit_results:
+        return {"selected_reddit_urls": []}
+
+    selector = state.get("reddit_selector") or REDDIT_SELECTOR
+    if selector == "llm":
+        return select_reddit_urls_llm(state, reddit_results)
 
+    top, confident = rank_results(state["user_question"], reddit_results, k=REDDIT_THREADS)
+    if selector == "hybrid" and not confident:
+        return select_reddit_urls_llm(state, reddit_results)
+    return {"selected_reddit_urls": [r['link'] for r in top]}
+
+@with_deadline("reddit", "branch", {"reddit_post_data": []})
 def scrape_reddit_content_node(state: AgentState):
     urls = state.get("selected_reddit_urls", [])
-    content = reddit_post_retrieval(urls)
+    # Let the scraper give up on its own instead of outliving the budget
+    remaining = time_left(state, "branch")
+    deadline = REDDIT_SCRAPE_DEADLINE if remaining is None else max(0.0, min(REDDIT_SCRAPE_DEADLINE, remaining))
+    content = reddit_post_retrieval(urls, deadline=deadline, query=state["user_question"])
     return {"reddit_post_data": content}
 
+# --- CONTEXT PACKING ---
+def pack_context_node(state: AgentState):
+    # Google and DuckDuckGo often return the same pages: drop those once here
+    # so neither analysis (nor conflict detection) pays for them twice.
+    enrich = None
+    if state.get("page_fetch", PAGE_FETCH):
+        # Page fetches share the budget of the branch they delay
+        remaining = time_left(state, "branch")
+        deadline = PAGE_FETCH_DEADLINE if remaining is None else max(0.0, min(PAGE_FETCH_DEADLINE, remaining))
+        enrich = functools.partial(enrich_results, state["user_question"], deadline=deadline)
+    contexts, stats = pack_web_results(state["user_question"], {
+        "google": state.get("google_results", []),
+        "duckduckgo": state.get("duckduckgo_results", []),
+    }, enrich=enrich)
+    return {
+        "google_context": contexts["google"],
+        "duckduckgo_context": contexts["duckduckgo"],
+        "web_context_stats": stats,
+    }
+
 # --- ANALYSIS NODES ---
-def analyze_google(state: AgentState):
-    print("--- [Node] Analyzing Google Data ---")
-    results = state["google_results"]
-    context = "\n".join([f"Title: {r['title']}\nSnippet: {r['snippet']}" for r in results])
-    messages = get_google_analysis_messages(state["user_question"], context)
-    response = llm.invoke(messages)
-    return {"google_analysis": response.content}
+# Prompt builders return (messages, update). When there is nothing to ask,
+# messages is None and update is the node's whole result; otherwise update
+# holds any extra keys. Batch mode (batch.py) reuses them to group the
+# prompts of concurrent questions into llm.batch calls.
+def _empty_web_context(state, name, label):
+    # Why a source has no packed context, from pack_context's stats
+    stats = state.get("web_context_stats") or {}
+    if stats.get(f"{name}_unique_items"):
+        return f"{label} results did not fit the web context budget."
+    if stats.get(f"{name}_input_items"):
+        return f"{label} returned nothing beyond the pages already covered by Google."
+    return f"{label} search returned no data."
 
-def analyze_duckduckgo(state: AgentState):
-    print("--- [Node] Analyzing DuckDuckGo Data ---")
-    results = state["duckduckgo_results"]
-    context = "\n".join([f"Title: {r['title']}\nSnippet: {r['snippet']}" for r in results])
-    messages = get_duckduckgo_analysis_messages(state["user_question"], context)
-    response = llm.invoke(messages)
-    return {"duckduckgo_analysis": response.content}
+def google_analysis_prompt(state: AgentState):
+    context = state.get("google_context", "")
+    if not context:
+        return None, {"google_analysis": _empty_web_context(state, "google", "Google")}
+    return get_google_analysis_messages(state["user_question"], context), {}
 
-def analyze_reddit(state: AgentState):
-    # print("--- [Node] Analyzing Reddit Data ---")
-    
+def duckduckgo_analysis_prompt(state: AgentState):
+    context = state.get("duckduckgo_context", "")
+    if not context:
+        return None, {"duckduckgo_analysis": _empty_web_context(state, "duckduckgo", "DuckDuckGo")}
+    return get_duckduckgo_analysis_messages(state["user_question"], context), {}
+
+def reddit_analysis_prompt(state: AgentState):
     # Use .get() to be safe
     posts = state.get("reddit_post_data", [])
     
     # If there are no posts, return a default message IMMEDIATELY
     if not posts:
-        return {"reddit_analysis": "No relevant Reddit threads were found for this query."}
+        return None, {"reddit_analysis": "No relevant Reddit threads were found for this query."}
 
-    context = "\n\n".join(posts)
-    messages = get_reddit_analysis_messages(state["user_question"], context)
-    response = llm.invoke(messages)
-    return {"reddit_analysis": response.content}
+    packed, stats = pack_posts(state["user_question"], posts)
+    context = "\n\n".join(packed)
+    return get_reddit_analysis_messages(state["user_question"], context), {"reddit_context_stats": stats}
 
-def conflict_detector_node(state: AgentState):
-    print("--- [Node] Detecting Conflicts ---")
-    
+@with_deadline("google", "branch", {"google_analysis": "Google data was cut by the latency budget."})
+def analyze_google(state: AgentState):
+    print("--- [Node] Analyzing Google Data ---")
+    messages, update = google_analysis_prompt(state)
+    if messages is None:
+        return update
+    response = get_llm().invoke(messages)
+    return {**update, "google_analysis": response.content}
+
+@with_deadline("duckduckgo", "branch", {"duckduckgo_analysis": "DuckDuckGo data was cut by the latency budget."})
+def analyze_duckduckgo(state: AgentState):
+    print("--- [Node] Analyzing DuckDuckGo Data ---")
+    messages, update = duckduckgo_analysis_prompt(state)
+    if messages is None:
+        return update
+    response = get_llm().invoke(messages)
+    return {**update, "duckduckgo_analysis": response.content}
+
+@with_deadline("reddit", "branch", {"reddit_analysis": "Reddit data was cut by the latency budget."})
+def analyze_reddit(state: AgentState):
+    # print("--- [Node] Analyzing Reddit Data ---")
+    messages, update = reddit_analysis_prompt(state)
+    if messages is None:
+        return update
+    response = get_llm().invoke(messages)
+    return {**update, "reddit_analysis": response.content}
+
+def conflict_update(state: AgentState, llm):
     google_results = state.get("google_results", [])
     reddit_results = state.get("reddit_post_data", [])
     
-    # If missing data, skip conflict detection
-    if not google_results or not reddit_results:
-        return {"conflict_report": {}}
-        
-    # Format for analysis
-    google_text = "\n".join([f"- {r['title']}: {r['snippet']}" for r in google_results])
-    reddit_text = "\n".join(reddit_results[:3]) # Limit to top 3 threads to save tokens
-    
-    messages = get_conflict_detection_messages(google_text, reddit_text)
-    
-    # Define Structured Output for the report
-    class ConflictReport(BaseModel):
-        agreements: List[str] = Field(description="List of matching facts or opinions")
-        conflicts: List[str] = Field(description="List of contradictions or disagreements")
-        unique_google_insights: List[str] = Field(description="Information found only in Google results")
-        unique_reddit_insights: List[str] = Field(description="Information found only in Reddit results")
-        final_conflict_report: str = Field(description="A brief summary of the differences")
-
+    # Empty report when either side is missing; "map_reduce" mode compares all
+    # of the evidence in parallel chunks instead of the first few items
     try:
-        structured_llm = llm.with_structured_output(ConflictReport)
-        response = structured_llm.invoke(messages)
-        return {"conflict_report": response.model_dump()}
+        report = detect_conflicts(llm, google_results, reddit_results, mode=state.get("conflict_mode"))
+        return {"conflict_report": report}
     except Exception as e:
         print(f"Conflict Detection Error: {e}")
         return {"conflict_report": {}}
 
-def synthesize_node(state: AgentState):
-    print("--- [Node] Synthesizing Final Answer ---")
-    
+@with_deadline("conflict_report", "conflict", {"conflict_report": {}})
+def conflict_detector_node(state: AgentState):
+    print("--- [Node] Detecting Conflicts ---")
+    return conflict_update(state, get_llm())
+
+def _run_notes(state: AgentState, status):
+    notes = ""
+    missing = list(dict.fromkeys(state.get("missing_sources", [])))
+    if missing:
+        notes += f"\n\n_Sources cut by the latency budget: {', '.join(missing)}_"
+    failing = [f"{name} ({breaker})" for name, breaker in status.items() if breaker != "closed"]
+    if failing:
+        notes += f"\n\n_Providers failing fast (circuit breaker): {', '.join(failing)}_"
+    return notes
+
+def _partial_answer(state: AgentState):
+    # Used when synthesis itself runs out of budget: hand back the raw analyses
+    sections = [
+        ("Google", state.get("google_analysis")),
+        ("DuckDuckGo", state.get("duckduckgo_analysis")),
+        ("Reddit", state.get("reddit_analysis")),
+    ]
+    body = "\n\n".join(f"{name}: {text}" for name, text in sections if text)
+    answer = f"The final synthesis ran out of time; here are the per-source findings.\n\n{body}"
+    status = provider_status()
+    return {"final_answer": answer + _run_notes(state, status), "provider_status": status}
+
+# Stream the answer through the graph's "custom" stream mode as it is generated
+SYNTHESIS_STREAMING = os.getenv("SYNTHESIS_STREAMING", "1") == "1"
+
+def _stream_answer(messages):
+    from langgraph.config import get_stream_writer
+    writer = get_stream_writer()
+    parts = []
+    for chunk in get_llm().stream(messages):
+        text = _message_text(chunk)
+        if text:
+            parts.append(text)
+            writer({"type": "token", "node": "synthesize", "content": text})
+    return "".join(parts)
+
+def _message_text(message):
+    content = message.content
+    if isinstance(content, str):
+        return content
+    return "".join(block.get("text", "") for block in content if isinstance(block, dict))
+
+def synthesis_prompt(state: AgentState):
     # --- SAFE GET METHOD (Fixes the Crash) ---
     # We use .get(key, default_value) so it never fails
     g_analysis = state.get("google_analysis", "Google search returned no data.")
@@ -168,73 +336,234 @@ def synthesize_node(state: AgentState):
     r_analysis = state.get("reddit_analysis", "No Reddit discussions found.")
     conflict_report = state.get("conflict_report", {})
 
-    messages = get_synthesis_messages(
+    return get_synthesis_messages(
         state["user_question"],
         g_analysis,
         d_analysis,
         r_analysis,
-        conflict_report
+        conflict_report,
+        missing_sources=state.get("missing_sources", []),
+        instructions=state.get("synthesis_instructions")
     )
-    
+
+def synthesis_result(state: AgentState, status, answer=None, error=None):
+    if error is not None:
+        # Flagged so resume_research() knows to retry synthesis from the checkpoint
+        return {"final_answer": f"Error generating answer: {error}", "provider_status": status, "synthesis_failed": True}
+    return {"final_answer": answer + _run_notes(state, status), "provider_status": status, "synthesis_failed": False}
+
+@with_deadline("synthesis", "synthesis", _partial_answer)
+def synthesize_node(state: AgentState):
+    print("--- [Node] Synthesizing Final Answer ---")
+    messages = synthesis_prompt(state)
+    status = provider_status()
     try:
-        response = llm.invoke(messages)
-        return {"final_answer": response.content}
+        answer = _stream_answer(messages) if SYNTHESIS_STREAMING else get_llm().invoke(messages).content
+        return synthesis_result(state, status, answer)
     except Exception as e:
-        return {"final_answer": f"Error generating answer: {e}"}
+        return synthesis_result(state, status, error=e)
     
 
 # --- BUILD GRAPH ---
-graph_builder = StateGraph(AgentState)
-
-# Add Nodes
-graph_builder.add_node("google", google_search_node)
-graph_builder.add_node("duckduckgo", duckduckgo_search_node)
-graph_builder.add_node("reddit_search", reddit_search_node)
-graph_builder.add_node("reddit_select", select_reddit_urls_node)
-graph_builder.add_node("reddit_scrape", scrape_reddit_content_node)
-graph_builder.add_node("analyze_google", analyze_google)
-graph_builder.add_node("analyze_duckduckgo", analyze_duckduckgo)
-graph_builder.add_node("analyze_reddit", analyze_reddit)
-graph_builder.add_node("conflict_detector", conflict_detector_node)
-graph_builder.add_node("synthesize", synthesize_node)
-
-# Add Edges (Logic Flow)
-# 1. Start all searches in parallel
-graph_builder.add_edge(START, "google")
-graph_builder.add_edge(START, "duckduckgo")
-graph_builder.add_edge(START, "reddit_search")
-
-# 2. Simple paths (Search -> Analyze)
-graph_builder.add_edge("google", "analyze_google")
-graph_builder.add_edge("duckduckgo", "analyze_duckduckgo")
-
-# 3. Complex path (Reddit Search -> Select -> Scrape -> Analyze)
-graph_builder.add_edge("reddit_search", "reddit_select")
-graph_builder.add_edge("reddit_select", "reddit_scrape")
-graph_builder.add_edge("reddit_scrape", "analyze_reddit")
-
-# 4. Conflict Detection (Wait for Google & Reddit Analysis)
-graph_builder.add_edge("analyze_google", "conflict_detector")
-graph_builder.add_edge("analyze_reddit", "conflict_detector")
-
-# 5. Merge all into Synthesis
-graph_builder.add_edge("conflict_detector", "synthesize")
-graph_builder.add_edge("analyze_duckduckgo", "synthesize")
-
-graph_builder.add_edge("synthesize", END)
-
-# Compile
-graph = graph_builder.compile()
+# name -> (node, state keys it reads, state keys it writes). Edges follow the
+# data: the searches start at once, the conflict report starts as soon as the
+# raw Google results and Reddit threads exist (in parallel with the per-source
+# analyses), and synthesis joins everything. The missing_sources log that
+# with_deadline appends to is not a dependency.
+NODE_SPECS = {
+    "google": (google_search_node, ("user_question",), ("google_results",)),
+    "duckduckgo": (duckduckgo_search_node, ("user_question",), ("duckduckgo_results",)),
+    "reddit_search": (reddit_search_node, ("user_question",), ("reddit_results",)),
+    "reddit_select": (select_reddit_urls_node, ("user_question", "reddit_results", "reddit_selector"), ("selected_reddit_urls",)),
+    "reddit_scrape": (scrape_reddit_content_node, ("user_question", "selected_reddit_urls"), ("reddit_post_data",)),
+    "pack_context": (pack_context_node, ("user_question", "google_results", "duckduckgo_results", "page_fetch"),
+                     ("google_context", "duckduckgo_context", "web_context_stats")),
+    "analyze_google": (analyze_google, ("user_question", "google_context", "web_context_stats"), ("google_analysis",)),
+    "analyze_duckduckgo": (analyze_duckduckgo, ("user_question", "duckduckgo_context", "web_context_stats"), ("duckduckgo_analysis",)),
+    "analyze_reddit": (analyze_reddit, ("user_question", "reddit_post_data"), ("reddit_analysis", "reddit_context_stats")),
+    "conflict_detector": (conflict_detector_node, ("google_results", "reddit_post_data", "conflict_mode"), ("conflict_report",)),
+    "synthesize": (synthesize_node,
+                   ("user_question", "google_analysis", "duckduckgo_analysis", "reddit_analysis", "conflict_report",
+                    "missing_sources", "synthesis_instructions"),
+                   ("final_answer", "provider_status", "synthesis_failed")),
+}
+NODE_DEPENDENCIES = node_dependencies({name: (reads, writes) for name, (_, reads, writes) in NODE_SPECS.items()})
+
+# State keys kept in the blob store (blobstore.py): checkpoints hold a
+# reference, and only the nodes that read a key load its value
+BLOB_KEYS = {
+    "google_results", "duckduckgo_results", "reddit_results", "reddit_post_data",
+    "google_context", "duckduckgo_context", "google_analysis", "duckduckgo_analysis", "reddit_analysis",
+}
+
+def build_graph():
+    from langgraph.graph import StateGraph, START, END
+
+    graph_builder = StateGraph(AgentState)
+
+    # Add Nodes (each one timed and traced under its graph name)
+    for name, (node, reads, writes) in NODE_SPECS.items():
+        graph_builder.add_node(name, traced("node", name)(with_blobs(node, reads, writes, BLOB_KEYS)))
+
+    # Add Edges (derived from what each node reads). A list of sources is a
+    # join: the node runs once, after all of them finish.
+    for name, upstream in NODE_DEPENDENCIES.items():
+        graph_builder.add_edge(upstream if len(upstream) > 1 else (upstream or [START])[0], name)
+    for name in sinks(NODE_DEPENDENCIES):
+        graph_builder.add_edge(name, END)
+
+    return graph_builder
+
+def initial_state(question, latency_budget=None, **overrides):
+    # started_at anchors the latency budget for every node in the run
+    state = {
+        "user_question": question,
+        "latency_budget": DEFAULT_LATENCY_BUDGET if latency_budget is None else latency_budget,
+        "started_at": time.time(),
+    }
+    state.update({key: value for key, value in overrides.items() if value is not None})
+    return state
+
+def run_graph(graph_input, config, on_token=None):
+    # graph.invoke(), or with on_token the run is streamed and every synthesis
+    # token is passed to on_token as it arrives
+    if on_token is None:
+        return get_graph().invoke(graph_input, config)
+    for chunk in get_graph().stream(graph_input, config, stream_mode="custom"):
+        if chunk.get("type") == "token":
+            on_token(chunk["content"])
+    # A forked config pins the fork point; read the thread's latest state instead
+    return get_graph().get_state(run_config(config["configurable"]["thread_id"])).values
+
+# --- RESUME / RE-SYNTHESIZE ---
+class RunNotResumable(ValueError):
+    pass
+
+def _check_blobs(run_id, values):
+    # Saved values live in the blob store, which evicts by size: fail up front
+    # rather than with a KeyError halfway through the run
+    missing = state_blobs.missing(values)
+    if missing:
+        raise RunNotResumable(f"Run {run_id} is no longer resumable: {len(missing)} of its saved values were evicted from the blob store")
+
+def _pre_synthesis_config(config):
+    # Newest checkpoint where everything upstream of synthesis is done
+    for snapshot in get_graph().get_state_history(config):
+        if snapshot.next == ("synthesize",):
+            return snapshot.config
+    return None
+
+def _update_state(config, values):
+    # update_state() acts as if a single node had just run, which would drop
+    # the other pending branches of a parallel step. Attribute the edit to
+    # every node of the last executed step instead (earlier edits skipped),
+    # so exactly the pending nodes run.
+    snapshot = get_graph().get_state(config)
+    while snapshot.metadata.get("source") == "update" and snapshot.parent_config:
+        snapshot = get_graph().get_state(snapshot.parent_config)
+    parent = get_graph().get_state(snapshot.parent_config) if snapshot.parent_config else None
+    if parent is None or not parent.next:
+        return get_graph().update_state(config, values)
+    from langgraph.types import StateUpdate
+    first, *rest = parent.next
+    return get_graph().bulk_update_state(config, [[StateUpdate(values, first)] + [StateUpdate(None, name) for name in rest]])
+
+def resynthesize(run_id, instructions=None, on_token=None):
+    # Forks the saved run right before synthesis, so only the synthesis call is repeated
+    base = _pre_synthesis_config(run_config(run_id))
+    if base is None:
+        raise ValueError(f"Run {run_id} has no checkpoint with completed upstream nodes")
+    _check_blobs(run_id, get_graph().get_state(base).values)
+    forked = _update_state(base, {"synthesis_instructions": instructions or "", "started_at": time.time()})
+    return run_graph(None, forked, on_token)
+
+def resume_research(run_id, on_token=None):
+    config = run_config(run_id)
+    snapshot = get_graph().get_state(config)
+    if not snapshot.values:
+        raise ValueError(f"Unknown run {run_id}")
+    if snapshot.next:
+        # Interrupted or crashed: continue with a fresh budget. The refresh goes
+        # in as a resume Command, so the writes of nodes that already finished
+        # in the failed step are kept and only the unfinished ones run again.
+        _check_blobs(run_id, snapshot.values)
+        from langgraph.types import Command
+        return run_graph(Command(update={"started_at": time.time()}), config, on_token)
+    if snapshot.values.get("synthesis_failed"):
+        return resynthesize(run_id, snapshot.values.get("synthesis_instructions"), on_token)
+    return snapshot.values
 
 # --- RUNNER ---
 if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Multi-Agent Search System")
+    parser.add_argument("--run-id", help="id to checkpoint this run under (default: random)")
+    parser.add_argument("--resume", metavar="RUN_ID", help="resume a failed or interrupted run")
+    parser.add_argument("--resynthesize", metavar="RUN_ID", help="re-run only the synthesis of a saved run")
+    parser.add_argument("--instructions", help="extra synthesis instructions (with --resynthesize)")
+    parser.add_argument("--batch", metavar="FILE", help="research every question in FILE (one per line, - for stdin)")
+    parser.add_argument("--output", default="batch_results.jsonl", help="JSON Lines results of --batch, one per question")
+    parser.add_argument("--concurrency", type=int, help="parallel calls per stage with --batch (default BATCH_MAX_CONCURRENCY)")
+    args = parser.parse_args()
+
+    if args.batch:
+        import sys
+        import json
+        from batch import run_batch
+
+        if args.batch == "-":
+            lines = sys.stdin.readlines()
+        else:
+            with open(args.batch) as f:
+                lines = f.readlines()
+        questions = [line.strip() for line in lines if line.strip()]
+        started = time.time()
+        # Each line is written as soon as its question is done
+        with open(args.output, "w") as out:
+            for result in run_batch(questions, max_concurrency=args.concurrency):
+                out.write(json.dumps(result, default=str) + "\n")
+                out.flush()
+        elapsed = time.time() - started
+        print(f"\n{len(questions)} questions in {elapsed:.1f}s ({len(questions) / elapsed * 60:.1f} questions/min), results in {args.output}")
+        sys.exit(0)
+
+    def print_report_header():
+        print("\n" + "="*50)
+        print("FINAL RESEARCH REPORT")
+        print("="*50 + "\n")
+
+    # The answer is printed token by token while synthesis is still running
+    streamed = []
+    def print_token(text):
+        if not streamed:
+            print_report_header()
+        streamed.append(text)
+        print(text, end="", flush=True)
+
     print("--- Multi-Agent Search System (Gemini + SerpApi + DDG) ---")
-    q = input("What do you want to research? ")
-    
-    initial_state = {"user_question": q}
-    result = graph.invoke(initial_state)
+    with trace_run("research"):
+        if args.resume:
+            run_id = args.resume
+            result = resume_research(run_id, on_token=print_token)
+        elif args.resynthesize:
+            run_id = args.resynthesize
+            result = resynthesize(run_id, args.instructions, on_token=print_token)
+        else:
+            q = input("What do you want to research? ")
+            config = run_config(args.run_id)
+            run_id = config["configurable"]["thread_id"]
+            result = run_graph(initial_state(q), config, on_token=print_token)
     
-    print("\n" + "="*50)
-    print("FINAL RESEARCH REPORT")
-    print("="*50 + "\n")
-    print(result["final_answer"])
\ No newline at end of file
+    answer = result["final_answer"]
+    streamed_text = "".join(streamed)
+    if not streamed:
+        print_report_header()
+        print(answer)
+    elif answer.startswith(streamed_text):
+        # Only the run notes are left
+        print(answer[len(streamed_text):])
+    else:
+        # Synthesis was cut off mid-stream and replaced by the partial answer
+        print("\n\n" + answer)
+    print(f"\n(run id: {run_id})")
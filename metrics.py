@@ -0,0 +1,265 @@
+import os
+import time
+import uuid
+import threading
+import functools
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+
+try:
+    from opentelemetry import trace as otel_trace
+except ImportError:  # OpenTelemetry is optional; spans are still recorded locally
+    otel_trace = None
+
+# --- METRICS REGISTRY ---
+# Small in-process registry rendered in the Prometheus text format by /metrics.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(label, "")) for label in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        key = tuple(str(labels.get(label, "")) for label in self.labels)
+        with self._lock:
+            return self._values.get(key, 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._values = {}  # key -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(label, "")) for label in self.labels)
+        with self._lock:
+            entry = self._values.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[i] += 1
+            entry[-2] += value
+            entry[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, entry in sorted(self._values.items()):
+                for bound, count in zip(self.buckets, entry):
+                    labels = _format_labels(self.labels + ("le",), key + (repr(float(bound)),))
+                    lines.append(f"{self.name}_bucket{labels} {count}")
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels + ('le',), key + ('+Inf',))} {entry[-1]}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {entry[-2]}")
+                lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {entry[-1]}")
+        return lines
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+DURATION = Histogram("agent_duration_seconds", "Wall time of graph nodes and tools", ("kind", "name"))
+CALLS = Counter("agent_calls_total", "Calls to graph nodes and tools", ("kind", "name"))
+ERRORS = Counter("agent_errors_total", "Errors raised or swallowed by graph nodes and tools", ("kind", "name"))
+BYTES_FETCHED = Counter("agent_bytes_fetched_total", "Response bytes received by tools", ("tool",))
+LLM_TOKENS = Counter("agent_llm_tokens_total", "LLM tokens by graph node and direction", ("node", "direction"))
+LLM_CALLS = Counter("agent_llm_calls_total", "LLM invocations by graph node and cache outcome", ("node", "cache"))
+RATE_LIMIT_WAIT = Histogram("agent_rate_limit_wait_seconds", "Time spent queued behind a provider rate limit", ("provider",))
+RATE_LIMITED = Counter("agent_rate_limited_total", "Calls rejected by a provider rate limit", ("provider",))
+
+_METRICS = [DURATION, CALLS, ERRORS, BYTES_FETCHED, LLM_TOKENS, LLM_CALLS, RATE_LIMIT_WAIT, RATE_LIMITED]
+_stats_sources = []  # (prefix, label name, label value, stats function)
+
+def register_stats(prefix, label, value, stats_fn):
+    # Numeric fields of stats_fn() are exported as agent_<prefix>_<field>{label="value"}
+    _stats_sources.append((prefix, label, value, stats_fn))
+
+def render_prometheus():
+    lines = []
+    for metric in _METRICS:
+        lines.extend(metric.render())
+
+    families = {}
+    for prefix, label, value, stats_fn in _stats_sources:
+        for field, number in stats_fn().items():
+            if isinstance(number, bool) or not isinstance(number, (int, float)):
+                continue
+            families.setdefault(f"agent_{prefix}_{field}", []).append((label, value, number))
+    for name, samples in sorted(families.items()):
+        lines.append(f"# TYPE {name} gauge")
+        for label, value, number in samples:
+            lines.append(f"{name}{_format_labels((label,), (value,))} {number}")
+    return "\n".join(lines) + "\n"
+
+
+# --- SPANS (per graph run) ---
+TRACE_HISTORY = int(os.getenv("TRACE_HISTORY", "100"))
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+_current_span = contextvars.ContextVar("current_span", default=None)
+_finished_traces = deque(maxlen=TRACE_HISTORY)
+_traces_lock = threading.Lock()
+_tracer = otel_trace.get_tracer("conflict-detector-agent") if otel_trace else None
+
+class Trace:
+    def __init__(self, name, trace_id=None):
+        self.trace_id = trace_id or uuid.uuid4().hex
+        self.name = name
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def to_dict(self):
+        with self._lock:
+            spans = list(self.spans)
+        return {"trace_id": self.trace_id, "name": self.name, "spans": spans}
+
+@contextmanager
+def trace_run(name="research", trace_id=None):
+    # Collects every span started inside this context (including worker threads
+    # that copied the context) into one trace, kept in memory for /api/traces
+    run_trace = Trace(name, trace_id)
+    previous = _current_trace.get()
+    _current_trace.set(run_trace)
+    try:
+        with span(name, kind="run"):
+            yield run_trace
+    finally:
+        # set() rather than reset(token): async generators may be closed from another context
+        _current_trace.set(previous)
+        with _traces_lock:
+            _finished_traces.append(run_trace)
+
+def get_trace(trace_id):
+    with _traces_lock:
+        for run_trace in _finished_traces:
+            if run_trace.trace_id == trace_id:
+                return run_trace.to_dict()
+    return None
+
+def recent_traces():
+    with _traces_lock:
+        return [{"trace_id": t.trace_id, "name": t.name, "spans": len(t.spans)} for t in _finished_traces]
+
+def current_node():
+    current = _current_span.get()
+    return current["node"] if current else ""
+
+def add_to_span(key, amount):
+    current = _current_span.get()
+    if current is not None:
+        current["attributes"][key] = current["attributes"].get(key, 0) + amount
+
+@contextmanager
+def span(name, kind="internal", **attributes):
+    parent = _current_span.get()
+    run_trace = _current_trace.get()
+    record = {
+        "trace_id": run_trace.trace_id if run_trace else None,
+        "span_id": uuid.uuid4().hex[:16],
+        "parent_span_id": parent["span_id"] if parent else None,
+        "name": name,
+        "kind": kind,
+        "node": name if kind == "node" else (parent["node"] if parent else ""),
+        "start_time": time.time(),
+        "end_time": None,
+        "status": "ok",
+        "attributes": dict(attributes),
+    }
+    _current_span.set(record)
+    otel_cm = _tracer.start_as_current_span(name) if _tracer else None
+    otel_span = otel_cm.__enter__() if otel_cm else None
+    try:
+        yield record
+    except BaseException as e:
+        record["status"] = "error"
+        record["attributes"]["error"] = str(e)
+        raise
+    finally:
+        record["end_time"] = time.time()
+        _current_span.set(parent)
+        if otel_span is not None:
+            for key, value in record["attributes"].items():
+                otel_span.set_attribute(key, value)
+            otel_cm.__exit__(None, None, None)
+        if run_trace is not None:
+            run_trace.add(record)
+
+
+# --- INSTRUMENTATION HELPERS ---
+def traced(kind, name):
+    # Wall time, call and error counts plus a span for a node or tool
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            CALLS.inc(kind=kind, name=name)
+            started = time.perf_counter()
+            try:
+                with span(name, kind=kind):
+                    return fn(*args, **kwargs)
+            except Exception:
+                ERRORS.inc(kind=kind, name=name)
+                raise
+            finally:
+                DURATION.observe(time.perf_counter() - started, kind=kind, name=name)
+        return wrapper
+    return decorator
+
+def record_error(kind, name):
+    # For code paths that swallow exceptions and return an empty result
+    ERRORS.inc(kind=kind, name=name)
+    add_to_span("swallowed_errors", 1)
+
+def record_bytes(tool, size):
+    BYTES_FETCHED.inc(size, tool=tool)
+    add_to_span("bytes_fetched", size)
+
+def record_llm_call(cache_hit, usage=None):
+    node = current_node()
+    LLM_CALLS.inc(node=node, cache="hit" if cache_hit else "miss")
+    add_to_span("llm_cache_hits" if cache_hit else "llm_calls", 1)
+    if usage:
+        input_tokens = usage.get("input_tokens", 0)
+        output_tokens = usage.get("output_tokens", 0)
+        LLM_TOKENS.inc(input_tokens, node=node, direction="input")
+        LLM_TOKENS.inc(output_tokens, node=node, direction="output")
+        add_to_span("llm_input_tokens", input_tokens)
+        add_to_span("llm_output_tokens", output_tokens)
+
+def record_rate_limit(provider, waited=0.0, rejected=False):
+    if rejected:
+        RATE_LIMITED.inc(provider=provider)
+        add_to_span("rate_limited", 1)
+    elif waited:
+        RATE_LIMIT_WAIT.observe(waited, provider=provider)
+        add_to_span("rate_limit_wait_seconds", waited)
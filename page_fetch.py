@@ -0,0 +1,205 @@
+import os
+import re
+import time
+import codecs
+import contextvars
+from html.parser import HTMLParser
+from concurrent.futures import ThreadPoolExecutor, wait
+from urllib.parse import urlsplit
+
+from cache import TTLCache
+from context_packing import canonical_url, result_text
+from executors import host_semaphore
+from metrics import traced, record_bytes, record_error, register_stats
+from ranking import bm25_scores
+from singleflight import flights
+from web_operations import get_http_session
+
+# --- PAGE ENRICHMENT ---
+# Search snippets are a sentence or two. When enabled, the most relevant web
+# hits also get an excerpt of the page itself. Pages are fetched in parallel
+# over the shared keep-alive session. Only HTML is read, at most
+# PAGE_MAX_BYTES per page and within PAGE_FETCH_DEADLINE overall. The text
+# is extracted while the body streams in. The excerpt is the page's
+# paragraphs most relevant to the question, up to PAGE_EXCERPT_CHARS.
+
+PAGE_FETCH = os.getenv("PAGE_FETCH", "0") == "1"
+PAGE_FETCH_MAX_PAGES = int(os.getenv("PAGE_FETCH_MAX_PAGES", "6"))
+PAGE_FETCH_TIMEOUT = float(os.getenv("PAGE_FETCH_TIMEOUT", "5"))
+PAGE_FETCH_DEADLINE = float(os.getenv("PAGE_FETCH_DEADLINE", "8"))
+PAGE_FETCH_PER_HOST = int(os.getenv("PAGE_FETCH_PER_HOST", "2"))
+PAGE_MAX_BYTES = int(os.getenv("PAGE_MAX_BYTES", "524288"))
+PAGE_EXCERPT_CHARS = int(os.getenv("PAGE_EXCERPT_CHARS", "800"))
+
+PAGE_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (compatible; conflict-detector-agent)",
+    "Accept": "text/html,application/xhtml+xml;q=0.9",
+}
+_HTML_TYPES = {"text/html", "application/xhtml+xml"}
+_CHARSET_RE = re.compile(r"charset=[\"']?([\w.:-]+)", re.IGNORECASE)
+
+# Extracted paragraphs per page; the excerpt depends on the question, so it is cut per use
+page_cache = TTLCache(
+    "page",
+    max_entries=int(os.getenv("PAGE_CACHE_MAX_ENTRIES", "256")),
+    max_bytes=int(os.getenv("PAGE_CACHE_MAX_BYTES", "16777216")),
+    default_ttl=int(os.getenv("PAGE_CACHE_TTL", "3600")),
+)
+register_stats("cache", "cache", "page", page_cache.stats)
+
+
+# --- TEXT EXTRACTION ---
+_SKIP_TAGS = {"head", "script", "style", "noscript", "template", "svg", "nav", "header", "footer", "aside", "form", "iframe", "button"}
+_BLOCK_TAGS = {
+    "p", "div", "section", "article", "main", "li", "ul", "ol", "table", "tr", "td", "th", "dd", "dt",
+    "blockquote", "pre", "figcaption", "h1", "h2", "h3", "h4", "h5", "h6",
+}
+_MAIN_TAGS = {"article", "main"}
+_VOID_TAGS = {"br", "hr", "img", "input", "meta", "link", "area", "base", "col", "embed", "source", "track", "wbr"}
+MIN_BLOCK_CHARS = 40  # shorter blocks are menus, buttons and captions
+
+class PageTextExtractor(HTMLParser):
+    # Fed incrementally; collects paragraphs outside navigation, scripts and
+    # the like. Text inside <article>/<main> is preferred when there is enough.
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.blocks = []  # (inside article/main, text)
+        self.chars = 0
+        self._skip = 0
+        self._main = 0
+        self._parts = []
+        self._parts_main = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _VOID_TAGS:
+            if tag in ("br", "hr"):
+                self._flush()
+            return
+        if tag in _SKIP_TAGS:
+            self._skip += 1
+        elif tag in _BLOCK_TAGS:
+            self._flush()
+        if tag in _MAIN_TAGS:
+            self._main += 1
+
+    def handle_endtag(self, tag):
+        if tag in _SKIP_TAGS:
+            self._skip = max(0, self._skip - 1)
+        elif tag in _BLOCK_TAGS:
+            self._flush()
+        if tag in _MAIN_TAGS:
+            self._main = max(0, self._main - 1)
+
+    def handle_data(self, data):
+        if self._skip:
+            return
+        if not self._parts:
+            self._parts_main = self._main > 0
+        self._parts.append(data)
+
+    def _flush(self):
+        text = " ".join("".join(self._parts).split())
+        self._parts = []
+        if len(text) >= MIN_BLOCK_CHARS:
+            self.blocks.append((self._parts_main, text))
+            self.chars += len(text)
+
+    def text_blocks(self):
+        self._flush()
+        main = [text for in_main, text in self.blocks if in_main]
+        if sum(len(text) for text in main) >= PAGE_EXCERPT_CHARS // 2:
+            return main
+        return [text for _, text in self.blocks]
+
+
+def excerpt(question, blocks, budget=PAGE_EXCERPT_CHARS):
+    # The most relevant paragraphs (BM25) that fit the budget, in page order
+    scores = bm25_scores(question, blocks)
+    chosen, used = [], 0
+    for i in sorted(range(len(blocks)), key=lambda i: (-scores[i], i)):
+        if used + len(blocks[i]) <= budget:
+            chosen.append(i)
+            used += len(blocks[i]) + 1
+        elif not chosen:
+            return blocks[i][:budget].rsplit(" ", 1)[0] + " ..."
+    return " ".join(blocks[i] for i in sorted(chosen))
+
+
+# --- FETCHING ---
+def _decoder(content_type):
+    match = _CHARSET_RE.search(content_type)
+    try:
+        return codecs.getincrementaldecoder(match.group(1) if match else "utf-8")(errors="replace")
+    except LookupError:
+        return codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+@traced("tool", "page_fetch")
+def fetch_page_blocks(session, url, deadline_at):
+    # Paragraphs of an HTML page, or None for other content types and errors
+    remaining = deadline_at - time.monotonic()
+    if remaining <= 0:
+        raise TimeoutError("page fetch deadline expired before request started")
+    with host_semaphore("page", url, PAGE_FETCH_PER_HOST):
+        with session.get(url, headers=PAGE_HEADERS, timeout=min(PAGE_FETCH_TIMEOUT, remaining), stream=True) as response:
+            content_type = response.headers.get("Content-Type", "")
+            if response.status_code != 200 or content_type.split(";")[0].strip().lower() not in _HTML_TYPES:
+                return None
+            decoder = _decoder(content_type)
+            parser = PageTextExtractor()
+            received = 0
+            # Stop at the byte cap, the deadline, or once there is plenty of text to choose from
+            for chunk in response.iter_content(16384):
+                received += len(chunk)
+                parser.feed(decoder.decode(chunk))
+                if received >= PAGE_MAX_BYTES or parser.chars >= PAGE_EXCERPT_CHARS * 10 or time.monotonic() >= deadline_at:
+                    break
+    record_bytes("pages", received)
+    return parser.text_blocks()
+
+def _cached_page_blocks(session, url, deadline_at):
+    key = canonical_url(url)
+    hit, blocks = page_cache.get(key)
+    if hit:
+        return blocks
+    blocks = flights["page"].do(key, fetch_page_blocks, session, url, deadline_at)
+    if blocks is not None:
+        page_cache.set(key, blocks)
+    return blocks
+
+def enrich_results(question, results, deadline=PAGE_FETCH_DEADLINE, max_pages=PAGE_FETCH_MAX_PAGES):
+    # Returns copies of results; the max_pages hits that best match the
+    # question (by title and snippet) get a "page_excerpt" when their page
+    # could be read in time
+    candidates = [i for i, r in enumerate(results) if urlsplit(r.get("link") or "").scheme in ("http", "https")]
+    scores = bm25_scores(question, [result_text(results[i]) for i in candidates])
+    chosen = [i for _, i in sorted(zip(scores, candidates), key=lambda pair: (-pair[0], pair[1]))[:max_pages]]
+    enriched = [dict(r) for r in results]
+    if not chosen:
+        return enriched
+
+    print(f"--- [Tool] Fetching {len(chosen)} pages ---")
+    deadline_at = time.monotonic() + deadline
+    session = get_http_session()
+    executor = ThreadPoolExecutor(max_workers=len(chosen), thread_name_prefix="page-fetch")
+    try:
+        futures = {
+            i: executor.submit(contextvars.copy_context().run, _cached_page_blocks, session, results[i]["link"], deadline_at)
+            for i in chosen
+        }
+        wait(futures.values(), timeout=max(0.0, deadline_at - time.monotonic()))
+        for i, future in futures.items():
+            if not future.done():
+                future.cancel()
+                record_error("tool", "page_fetch")
+                continue
+            try:
+                blocks = future.result()
+            except Exception as e:
+                print(f"Failed to fetch {results[i]['link']}: {e}")
+                record_error("tool", "page_fetch")
+                continue
+            if blocks:
+                enriched[i]["page_excerpt"] = excerpt(question, blocks)
+        return enriched
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -47,7 +47,34 @@ def get_conflict_detection_messages(google_results, reddit_results):
         """)
     ]
 
-def get_synthesis_messages(user_question, google_analysis, ddg_analysis, reddit_analysis, conflict_report=None):
+def get_claim_extraction_messages(source_label, text):
+    return [
+        SystemMessage(content="You are a Fact Extractor. Break a source into short, self-contained factual claims or opinions."),
+        HumanMessage(content=f"""
+        Source: {source_label}
+        
+        {text}
+        
+        List the atomic claims this source makes. Each claim must be a single sentence that can be understood on its own.
+        Skip greetings, jokes and off-topic remarks.
+        """)
+    ]
+
+def get_claim_adjudication_messages(claim_pairs):
+    return [
+        SystemMessage(content="You are a Conflict Detector. Decide whether pairs of claims from Google Search (Mainstream/Official) and Reddit (Community/Personal) agree, contradict each other, or are unrelated."),
+        HumanMessage(content=f"""
+        Judge each numbered pair:
+        
+        {claim_pairs}
+        
+        Produce a JSON object with:
+        - verdicts: one entry per pair with its number, a relation ("agree", "conflict" or "unrelated") and a one-sentence note stating the shared point or the disagreement
+        - summary: a brief summary of the differences between the two sides
+        """)
+    ]
+
+def get_synthesis_messages(user_question, google_analysis, ddg_analysis, reddit_analysis, conflict_report=None, missing_sources=None, instructions=None):
     
     conflict_text = ""
     if conflict_report:
@@ -58,6 +85,16 @@ def get_synthesis_messages(user_question, google_analysis, ddg_analysis, reddit_
         Summary: {conflict_report.get('final_conflict_report', 'No conflicts detected.')}
         """
 
+    missing_text = ""
+    if missing_sources:
+        missing_text = f"""
+        --- MISSING SOURCES ---
+        These sources did not finish within the time budget and are missing: {', '.join(dict.fromkeys(missing_sources))}.
+        Answer from the remaining sources and say briefly which perspectives are missing.
+        """
+
+    instructions_text = f"Additional instructions: {instructions}" if instructions else ""
+
     return [
         SystemMessage(content="You are a Lead Researcher. Combine reports from Google, DuckDuckGo, and Reddit into a single comprehensive answer."),
         HumanMessage(content=f"""
@@ -68,8 +105,10 @@ def get_synthesis_messages(user_question, google_analysis, ddg_analysis, reddit_
         3. Reddit Report: {reddit_analysis}
         
         {conflict_text}
+        {missing_text}
         
         Construct the final answer. Start with a direct answer, then provide summarize details from the sources. 
         If there are conflicts between official sources (Google) and community (Reddit), explicitly highlight them using the Conflict Report data.
+        {instructions_text}
         """)
     ]
\ No newline at end of file
@@ -0,0 +1,137 @@
+import re
+import math
+from collections import Counter
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; the pure-Python scorer is used instead
+    np = None
+
+# --- LEXICAL RANKING (BM25) ---
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "but", "by", "can", "do", "does", "for", "from",
+    "how", "i", "in", "is", "it", "its", "me", "my", "of", "on", "or", "should", "so", "that",
+    "the", "this", "to", "was", "what", "when", "where", "which", "who", "why", "will", "with",
+    "you", "your", "reddit", "r",
+}
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+def tokenize(text):
+    return [t for t in _TOKEN_RE.findall((text or "").lower()) if t not in STOPWORDS]
+
+def _idf(n_docs, df):
+    return math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+
+def bm25_scores(query, documents, k1=1.5, b=0.75, use_numpy=None):
+    query_terms = list(dict.fromkeys(tokenize(query)))
+    doc_tokens = [tokenize(d) for d in documents]
+    if not documents or not query_terms:
+        return [0.0] * len(documents)
+
+    if use_numpy is None:
+        use_numpy = np is not None
+    if use_numpy and np is not None:
+        return _bm25_numpy(query_terms, doc_tokens, k1, b)
+
+    n_docs = len(doc_tokens)
+    lengths = [len(t) for t in doc_tokens]
+    avgdl = (sum(lengths) / n_docs) or 1.0
+    counts = [Counter(t) for t in doc_tokens]
+    df = {term: sum(1 for c in counts if term in c) for term in query_terms}
+
+    scores = []
+    for c, dl in zip(counts, lengths):
+        score = 0.0
+        for term in query_terms:
+            tf = c.get(term, 0)
+            if tf:
+                score += _idf(n_docs, df[term]) * tf * (k1 + 1) / (tf + k1 * (1 - b + b * dl / avgdl))
+        scores.append(score)
+    return scores
+
+def _bm25_numpy(query_terms, doc_tokens, k1, b):
+    # Vectorized over a (documents x query terms) frequency matrix
+    index = {term: j for j, term in enumerate(query_terms)}
+    tf = np.zeros((len(doc_tokens), len(query_terms)))
+    for i, tokens in enumerate(doc_tokens):
+        for token in tokens:
+            j = index.get(token)
+            if j is not None:
+                tf[i, j] += 1
+
+    lengths = np.array([len(t) for t in doc_tokens], dtype=float)
+    avgdl = lengths.mean() or 1.0
+    df = (tf > 0).sum(axis=0)
+    idf = np.log(1 + (len(doc_tokens) - df + 0.5) / (df + 0.5))
+    norm = k1 * (1 - b + b * lengths / avgdl)
+    scores = (idf * tf * (k1 + 1) / (tf + norm[:, None])).sum(axis=1)
+    return scores.tolist()
+
+def rank_results(query, results, k=3, use_numpy=None):
+    # Returns (top-k results, is_confident). Not confident means nothing matched
+    # the query or the cutoff falls inside a tie, so a tie-breaker is worthwhile.
+    documents = [f"{r.get('title') or ''} {r.get('snippet') or ''}" for r in results]
+    scores = bm25_scores(query, documents, use_numpy=use_numpy)
+
+    # Stable sort keeps the search engine's own order between equal scores
+    order = sorted(range(len(results)), key=lambda i: -scores[i])
+    top = [results[i] for i in order[:k]]
+
+    confident = bool(scores) and max(scores) > 0
+    if confident and len(order) > k:
+        confident = scores[order[k - 1]] > scores[order[k]]
+    return top, confident
+
+def term_coverage(query, text):
+    # Share of the query's distinct terms that occur in text (0..1)
+    terms = set(tokenize(query))
+    if not terms:
+        return 1.0
+    return len(terms & set(tokenize(text))) / len(terms)
+
+# --- TF-IDF COSINE ---
+def _tfidf_vectors(token_lists):
+    n_docs = len(token_lists)
+    df = Counter(term for tokens in token_lists for term in set(tokens))
+    vectors = []
+    for tokens in token_lists:
+        counts = Counter(tokens)
+        vector = {term: (1 + math.log(tf)) * math.log((1 + n_docs) / (1 + df[term])) for term, tf in counts.items()}
+        norm = math.sqrt(sum(w * w for w in vector.values())) or 1.0
+        vectors.append({term: w / norm for term, w in vector.items()})
+    return vectors
+
+def cosine_matrix(left, right, use_numpy=None):
+    # len(left) x len(right) cosine similarities, with IDF over both sides
+    if not left or not right:
+        return [[0.0] * len(right) for _ in left]
+    tokens = [tokenize(t) for t in list(left) + list(right)]
+    if use_numpy is None:
+        use_numpy = np is not None
+    if use_numpy and np is not None:
+        return _cosine_numpy(tokens, len(left))
+
+    vectors = _tfidf_vectors(tokens)
+    left_vectors, right_vectors = vectors[:len(left)], vectors[len(left):]
+    return [
+        [sum((w * r.get(term, 0.0) for term, w in l.items()), 0.0) for r in right_vectors]
+        for l in left_vectors
+    ]
+
+def _cosine_numpy(tokens, n_left):
+    # Sublinear TF-IDF matrix, L2-normalised rows, one matrix product
+    vocab = {}
+    rows, cols, values = [], [], []
+    for i, doc in enumerate(tokens):
+        for term, tf in Counter(doc).items():
+            rows.append(i)
+            cols.append(vocab.setdefault(term, len(vocab)))
+            values.append(1 + math.log(tf))
+    matrix = np.zeros((len(tokens), max(len(vocab), 1)))
+    matrix[rows, cols] = values
+    df = (matrix > 0).sum(axis=0)
+    matrix *= np.log((1 + len(tokens)) / (1 + df))
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    matrix /= np.where(norms == 0, 1.0, norms)
+    return (matrix[:n_left] @ matrix[n_left:].T).tolist()
@@ -0,0 +1,201 @@
+import os
+import time
+import sqlite3
+import threading
+
+from metrics import register_stats, record_rate_limit
+
+# --- RATE LIMITING ---
+# Token buckets per provider, for requests per minute and (for Gemini) tokens
+# per minute. A caller reserves capacity before each provider request. If the
+# bucket is short it either sleeps until the reservation is due ("wait",
+# which turns bursts into a smooth queue) or raises RateLimited ("fail").
+# With RATE_LIMIT_BACKEND=sqlite the buckets live in a shared SQLite file,
+# so several uvicorn workers draw from the same quota.
+
+RATE_LIMIT_MODE = os.getenv("RATE_LIMIT_MODE", "wait")
+RATE_LIMIT_MAX_WAIT = float(os.getenv("RATE_LIMIT_MAX_WAIT", "30"))
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+RATE_LIMIT_DB = os.getenv("RATE_LIMIT_DB", "ratelimit.sqlite")
+
+class RateLimited(Exception):
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _reserve(state, buckets, max_wait, now):
+    # state: name -> (level, updated_at). buckets: (name, capacity, per_second, amount).
+    # All-or-nothing: returns (wait, new state), or (wait, None) when the wait is over max_wait.
+    new_state, wait = {}, 0.0
+    for name, capacity, per_second, amount in buckets:
+        level, updated_at = state.get(name, (capacity, now))
+        level = min(capacity, level + (now - updated_at) * per_second)
+        amount = min(amount, capacity)
+        # The level may go negative: later callers queue behind this reservation
+        wait = max(wait, (amount - level) / per_second)
+        new_state[name] = (level - amount, now)
+    if wait > max_wait:
+        return wait, None
+    return max(0.0, wait), new_state
+
+
+class MemoryBackend:
+    def __init__(self):
+        self._state = {}
+        self._lock = threading.Lock()
+
+    def reserve(self, buckets, max_wait):
+        with self._lock:
+            wait, new_state = _reserve(self._state, buckets, max_wait, time.time())
+            if new_state:
+                self._state.update(new_state)
+            return wait, new_state is not None
+
+    def adjust(self, name, capacity, amount):
+        with self._lock:
+            level, updated_at = self._state.get(name, (capacity, time.time()))
+            self._state[name] = (level - amount, updated_at)
+
+
+class SqliteBackend:
+    # One row per bucket; BEGIN IMMEDIATE serialises reservations across processes
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, level REAL, updated_at REAL)")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self, fn):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = fn(conn)
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return result
+
+    def reserve(self, buckets, max_wait):
+        def run(conn):
+            names = [b[0] for b in buckets]
+            rows = conn.execute(
+                f"SELECT name, level, updated_at FROM buckets WHERE name IN ({','.join('?' * len(names))})", names
+            ).fetchall()
+            wait, new_state = _reserve({n: (l, u) for n, l, u in rows}, buckets, max_wait, time.time())
+            if new_state:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO buckets (name, level, updated_at) VALUES (?, ?, ?)",
+                    [(name, level, updated_at) for name, (level, updated_at) in new_state.items()],
+                )
+            return wait, new_state is not None
+        return self._transaction(run)
+
+    def adjust(self, name, capacity, amount):
+        def run(conn):
+            conn.execute("INSERT OR IGNORE INTO buckets (name, level, updated_at) VALUES (?, ?, ?)", (name, capacity, time.time()))
+            conn.execute("UPDATE buckets SET level = level - ? WHERE name = ?", (amount, name))
+        self._transaction(run)
+
+
+class RateLimiter:
+    def __init__(self, name, rpm=0, tpm=0, backend=None, mode=RATE_LIMIT_MODE, max_wait=RATE_LIMIT_MAX_WAIT):
+        env = name.upper()
+        self.name = name
+        self.rpm = float(os.getenv(f"RATE_{env}_RPM", str(rpm)))
+        self.tpm = float(os.getenv(f"RATE_{env}_TPM", str(tpm)))
+        # Burst = how much may go out at once; defaults to a full minute's quota
+        self.request_burst = float(os.getenv(f"RATE_{env}_BURST", str(self.rpm)))
+        self.mode = os.getenv(f"RATE_{env}_MODE", mode)
+        self.max_wait = max_wait
+        self.backend = backend or MemoryBackend()
+        self._lock = threading.Lock()
+        self._stats = {"acquired": 0, "waited": 0, "rejected": 0, "wait_seconds": 0.0}
+
+    @property
+    def enabled(self):
+        return self.rpm > 0 or self.tpm > 0
+
+    def _buckets(self, requests, tokens):
+        buckets = []
+        if self.rpm > 0 and requests:
+            buckets.append((f"{self.name}:requests", max(self.request_burst, 1.0), self.rpm / 60, requests))
+        if self.tpm > 0 and tokens:
+            buckets.append((f"{self.name}:tokens", self.tpm, self.tpm / 60, tokens))
+        return buckets
+
+    def acquire(self, requests=1, tokens=0, wait=None, deadline_at=None):
+        # Returns the seconds slept; raises RateLimited instead of waiting in
+        # "fail" mode, or when the wait would overrun max_wait / deadline_at
+        # (a time.monotonic() value, as in resilient_call).
+        buckets = self._buckets(requests, tokens)
+        if not buckets:
+            return 0.0
+        should_wait = self.mode == "wait" if wait is None else wait
+        max_wait = self.max_wait if should_wait else 0.0
+        if deadline_at is not None:
+            max_wait = min(max_wait, max(0.0, deadline_at - time.monotonic()))
+
+        delay, granted = self.backend.reserve(buckets, max_wait)
+        if not granted:
+            self._record("rejected")
+            record_rate_limit(self.name, rejected=True)
+            raise RateLimited(f"{self.name} rate limit reached, next slot in {delay:.1f}s", retry_after=delay)
+
+        self._record("acquired")
+        if delay > 0:
+            print(f"--- [RateLimit] {self.name} waiting {delay:.2f}s ---")
+            self._record("waited", delay)
+            record_rate_limit(self.name, waited=delay)
+            time.sleep(delay)
+        return delay
+
+    def try_acquire(self, requests=1, tokens=0):
+        # Non-blocking: True if capacity was available right now
+        try:
+            self.acquire(requests, tokens, wait=False)
+            return True
+        except RateLimited:
+            return False
+
+    def settle(self, estimated_tokens, actual_tokens):
+        # Token reservations are estimates; charge or refund the difference
+        if self.tpm > 0 and actual_tokens is not None and actual_tokens != estimated_tokens:
+            self.backend.adjust(f"{self.name}:tokens", self.tpm, actual_tokens - estimated_tokens)
+
+    def _record(self, field, seconds=None):
+        with self._lock:
+            self._stats[field] += 1
+            if seconds:
+                self._stats["wait_seconds"] += seconds
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, "rpm": self.rpm, "tpm": self.tpm}
+
+
+def make_backend(kind=RATE_LIMIT_BACKEND):
+    return SqliteBackend(RATE_LIMIT_DB) if kind == "sqlite" else MemoryBackend()
+
+_backend = make_backend()
+
+# 0 = unlimited. SerpApi and Gemini quotas depend on the plan, so they are
+# opt-in; anonymous Reddit .json access is limited for everyone.
+rate_limiters = {
+    "serpapi": RateLimiter("serpapi", backend=_backend),
+    "duckduckgo": RateLimiter("duckduckgo", backend=_backend),
+    "reddit": RateLimiter("reddit", rpm=60, backend=_backend),
+    "gemini": RateLimiter("gemini", backend=_backend),
+}
+
+for _name, _limiter in rate_limiters.items():
+    register_stats("rate_limit", "provider", _name, _limiter.stats)
@@ -0,0 +1,249 @@
+import os
+import sys
+import time
+import random
+import threading
+import contextvars
+from collections import deque
+from email.utils import parsedate_to_datetime
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from metrics import register_stats
+from ratelimit import rate_limiters
+
+# --- PROVIDER RESILIENCE ---
+# Every provider call goes through resilient_call(): a per-provider circuit
+# breaker fails fast while a provider is sick, transient errors (429/5xx,
+# network timeouts and connection errors) count against it and are retried
+# with jittered exponential backoff (honouring Retry-After), and optionally a
+# hedged second attempt races the first once it is slower than the p95.
+# Every attempt first takes a slot from the provider's rate limiter.
+
+class ProviderError(Exception):
+    def __init__(self, message, status=None, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+class CircuitOpen(Exception):
+    pass
+
+class DeadlineExpired(Exception):
+    # Our own time budget ran out; says nothing about the provider's health
+    pass
+
+def is_transient(error):
+    # Worth a retry and a strike against the breaker; anything else (bad
+    # credentials, exhausted quota, a body we can't parse, our own deadline)
+    # is raised at once
+    if isinstance(error, ProviderError):
+        return error.status is not None and (error.status == 429 or error.status >= 500)
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    # requests is only imported by the scrapers; don't pull it in here
+    requests = sys.modules.get("requests")
+    return requests is not None and isinstance(error, (requests.Timeout, requests.ConnectionError))
+
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+_STATE_CODES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+class CircuitBreaker:
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+        self._stats = {"successes": 0, "failures": 0, "rejected": 0, "opened": 0}
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self):
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = HALF_OPEN
+            self._probe_in_flight = False
+        return self._state
+
+    def allow(self):
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and not self._probe_in_flight:
+                # Let exactly one probe through to test the provider
+                self._probe_in_flight = True
+                return True
+            self._stats["rejected"] += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._stats["successes"] += 1
+            self._failures = 0
+            self._state = CLOSED
+            self._probe_in_flight = False
+
+    def release_probe(self):
+        # The call ended without telling us anything about the provider
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._stats["failures"] += 1
+            self._failures += 1
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != OPEN:
+                    self._stats["opened"] += 1
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+    def stats(self):
+        with self._lock:
+            state = self._current_state()
+            return {**self._stats, "state": _STATE_CODES[state], "consecutive_failures": self._failures}
+
+
+class ProviderPolicy:
+    def __init__(self, name, retries=2, base_delay=0.5, max_delay=8.0,
+                 failure_threshold=5, reset_timeout=30.0, hedge=False):
+        env = name.upper()
+        self.name = name
+        self.retries = int(os.getenv(f"RETRIES_{env}", str(retries)))
+        self.base_delay = base_delay
+        self.max_delay = float(os.getenv(f"RETRY_MAX_DELAY_{env}", str(max_delay)))
+        self.hedge = os.getenv(f"HEDGE_{env}", "1" if hedge else "0") == "1"
+        self.breaker = CircuitBreaker(
+            name,
+            failure_threshold=int(os.getenv(f"BREAKER_THRESHOLD_{env}", str(failure_threshold))),
+            reset_timeout=float(os.getenv(f"BREAKER_RESET_{env}", str(reset_timeout))),
+        )
+        self._latencies = deque(maxlen=200)
+        self._lock = threading.Lock()
+
+    def record_latency(self, seconds):
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def hedge_delay(self):
+        # p95 of recent successful calls; no hedging until we have a baseline
+        with self._lock:
+            samples = sorted(self._latencies)
+        if len(samples) < 20:
+            return None
+        return samples[int(0.95 * (len(samples) - 1))]
+
+
+# SerpApi bills per search, so hedging it is opt-in (HEDGE_SERPAPI=1)
+policies = {
+    "serpapi": ProviderPolicy("serpapi", retries=2, failure_threshold=5, reset_timeout=30),
+    "duckduckgo": ProviderPolicy("duckduckgo", retries=2, base_delay=1.0, failure_threshold=3, reset_timeout=60, hedge=True),
+    "reddit": ProviderPolicy("reddit", retries=1, failure_threshold=8, reset_timeout=30),
+}
+
+for _name, _policy in policies.items():
+    register_stats("breaker", "provider", _name, _policy.breaker.stats)
+
+_hedge_executor = ThreadPoolExecutor(max_workers=int(os.getenv("HEDGE_WORKERS", "16")), thread_name_prefix="hedge")
+
+def retry_after_seconds(error):
+    # Retry-After from our own ProviderError or from a requests HTTPError response
+    value = getattr(error, "retry_after", None)
+    if value is None:
+        response = getattr(error, "response", None)
+        headers = getattr(response, "headers", None) or {}
+        value = headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def backoff_delay(policy, attempt):
+    # "Full jitter" exponential backoff
+    return random.uniform(0, min(policy.max_delay, policy.base_delay * (2 ** attempt)))
+
+def _hedged(policy, fn, args, kwargs):
+    delay = policy.hedge_delay()
+    if delay is None:
+        return fn(*args, **kwargs)
+
+    first = _hedge_executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+    done, _ = wait([first], timeout=delay)
+    if done:
+        return first.result()
+    # A hedge is an extra request: only send it if the rate limit has room now
+    limiter = rate_limiters.get(policy.name)
+    if limiter is not None and not limiter.try_acquire():
+        return first.result()
+
+    print(f"--- [Resilience] {policy.name} slower than p95 ({delay:.2f}s), hedging ---")
+    second = _hedge_executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+    pending = {first, second}
+    error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                return future.result()
+            error = future.exception()
+    raise error
+
+def resilient_call(provider, fn, *args, deadline_at=None, **kwargs):
+    policy = policies[provider]
+    breaker = policy.breaker
+    limiter = rate_limiters.get(provider)
+    attempt = 0
+    while True:
+        # Breaker first: an open circuit fails fast without queueing for (or spending) quota
+        if not breaker.allow():
+            raise CircuitOpen(f"{provider} circuit is open, failing fast")
+        if limiter is not None:
+            try:
+                # Raises RateLimited rather than waiting past the deadline
+                limiter.acquire(deadline_at=deadline_at)
+            except BaseException:
+                # Never reached the provider: a half-open probe goes back unused
+                breaker.release_probe()
+                raise
+
+        started = time.monotonic()
+        try:
+            result = _hedged(policy, fn, args, kwargs) if policy.hedge else fn(*args, **kwargs)
+        except Exception as e:
+            if not is_transient(e):
+                breaker.release_probe()
+                raise
+            breaker.record_failure()
+            if attempt >= policy.retries:
+                raise
+            delay = retry_after_seconds(e)
+            if delay is None:
+                delay = backoff_delay(policy, attempt)
+            # Waiting longer than we are allowed to is pointless
+            if delay > policy.max_delay or (deadline_at is not None and time.monotonic() + delay >= deadline_at):
+                raise
+            print(f"--- [Resilience] {provider} attempt {attempt + 1} failed ({e}), retrying in {delay:.2f}s ---")
+            time.sleep(delay)
+            attempt += 1
+            continue
+
+        breaker.record_success()
+        policy.record_latency(time.monotonic() - started)
+        return result
+
+def provider_status():
+    return {name: policy.breaker.state for name, policy in policies.items()}
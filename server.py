@@ -1,18 +1,50 @@
 import os
+import json
+import math
+import asyncio
+import time
+import threading
+from contextlib import asynccontextmanager
 from typing import List, Optional, Dict, Any
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, PlainTextResponse, JSONResponse
 from pydantic import BaseModel
 from dotenv import load_dotenv
-from langchain_google_genai import ChatGoogleGenerativeAI
+
+load_dotenv()
 
 # Import existing logic
+from executors import provider_pools, PoolSaturated
+from jobs import research_jobs, JobQueueFull, ClientLimitExceeded, SUCCEEDED, FINISHED
+from ratelimit import rate_limiters, RateLimited
+from resilience import policies
+from metrics import render_prometheus, trace_run, get_trace, recent_traces
 from web_operations import serp_search, duckduckgo_search, reddit_search_api, reddit_post_retrieval
-from prompts import get_conflict_detection_messages
+from conflicts import detect_conflicts
+from main import get_graph, get_llm, initial_state, resume_research, resynthesize, RunNotResumable
+from batch import run_batch, BATCH_MAX_CONCURRENCY, BATCH_MAX_QUESTIONS
+from checkpoints import run_config
+from blobstore import resolve_values
 
-load_dotenv()
+# Build the graph and LLM client in the background once the server is up, so
+# startup stays fast and the first request usually finds them ready
+PREWARM = os.getenv("PREWARM", "1") == "1"
+
+@asynccontextmanager
+async def lifespan(app):
+    if PREWARM:
+        threading.Thread(target=_prewarm, name="prewarm", daemon=True).start()
+    yield
 
-app = FastAPI(title="Search Agent API")
+def _prewarm():
+    try:
+        get_graph()
+        get_llm()
+    except Exception as e:
+        print(f"Warning: prewarm failed: {e}")
+
+app = FastAPI(title="Search Agent API", lifespan=lifespan)
 
 # --- CORS ---
 app.add_middleware(
@@ -24,34 +56,60 @@ app.add_middleware(
 )
 
 # --- LLM SETUP ---
-try:
-    llm = ChatGoogleGenerativeAI(model="gemini-2.5-flash")
-except Exception as e:
-    print(f"Warning: LLM setup failed: {e}")
-    llm = None
+# Shared with the graph and built on first use, so startup stays fast. The
+# first build imports the Gemini SDK (and may wait for prewarm), so async
+# handlers run it on a thread instead of the event loop.
+async def _llm():
+    try:
+        return await asyncio.to_thread(get_llm)
+    except Exception as e:
+        print(f"Warning: LLM setup failed: {e}")
+        raise HTTPException(status_code=503, detail="LLM not initialized")
 
 # --- MODELS ---
 class SearchRequest(BaseModel):
     query: str
 
+class ResearchRequest(BaseModel):
+    query: str
+    reddit_selector: Optional[str] = None  # "bm25", "llm" or "hybrid"
+    conflict_mode: Optional[str] = None  # "single", "map_reduce" or "claims"
+    page_fetch: Optional[bool] = None  # add page excerpts to web results; defaults to PAGE_FETCH
+    latency_budget: Optional[float] = None  # seconds; defaults to LATENCY_BUDGET
+
+class JobRequest(ResearchRequest):
+    priority: int = 0  # higher runs first
+    client_id: Optional[str] = None  # fairness key; defaults to X-Client-Id or the client address
+
+class BatchRequest(BaseModel):
+    questions: List[str]
+    reddit_selector: Optional[str] = None
+    conflict_mode: Optional[str] = None
+    page_fetch: Optional[bool] = None
+    latency_budget: Optional[float] = None
+    max_concurrency: Optional[int] = None  # capped at BATCH_MAX_CONCURRENCY
+
+class ResynthesizeRequest(BaseModel):
+    instructions: Optional[str] = None
+
 class ConflictRequest(BaseModel):
     google_results: List[Dict[str, Any]]
     reddit_results: List[str] # List of strings (post content)
-
-class ConflictReport(BaseModel):
-    agreements: List[str]
-    conflicts: List[str]
-    unique_google_insights: List[str]
-    unique_reddit_insights: List[str]
-    final_conflict_report: str
+    mode: Optional[str] = None  # "single" (first 3 threads), "map_reduce" (all evidence) or "claims" (claim pairs); defaults to CONFLICT_MODE
 
 # --- ENDPOINTS ---
 
+def _busy(error):
+    # Pool queue is full: tell the client to back off instead of piling on
+    return HTTPException(status_code=503, detail=str(error), headers={"Retry-After": "1"})
+
 @app.post("/api/search/google")
 async def search_google(request: SearchRequest):
     try:
-        results = serp_search(request.query, engine="google")
+        results = await provider_pools["serpapi"].run(serp_search, request.query, engine="google")
         return {"results": results}
+    except PoolSaturated as e:
+        raise _busy(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -59,40 +117,265 @@ async def search_google(request: SearchRequest):
 async def search_reddit(request: SearchRequest):
     try:
         # 1. Search for threads
-        search_results = reddit_search_api(request.query)
+        search_results = await provider_pools["serpapi"].run(reddit_search_api, request.query)
         
-        # 2. Select top 3 URLs (simplified logic for API speed)
-        top_urls = [r['link'] for r in search_results[:3]]
-        
-        # 3. Scrape content
-        post_content = reddit_post_retrieval(top_urls)
+        # 2./3. Scrape the top 3 threads (simplified logic for API speed). In
+        # bulk mode one by_id request covers every result and the 3 are the
+        # first that clear the score/relevance thresholds.
+        urls = [r['link'] for r in search_results]
+        post_content = await provider_pools["reddit"].run(reddit_post_retrieval, urls, query=request.query, max_threads=3)
         
         return {
             "threads": search_results,
             "content": post_content
         }
+    except PoolSaturated as e:
+        raise _busy(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/analyze/conflicts")
 async def analyze_conflicts(request: ConflictRequest):
-    if not llm:
-        raise HTTPException(status_code=503, detail="LLM not initialized")
-        
+    llm = await _llm()
     try:
-        google_text = "\n".join([f"- {r.get('title', '')}: {r.get('snippet', '')}" for r in request.google_results])
-        reddit_text = "\n".join(request.reddit_results[:3])
-        
-        messages = get_conflict_detection_messages(google_text, reddit_text)
-        
-        structured_llm = llm.with_structured_output(ConflictReport)
-        response = structured_llm.invoke(messages)
-        
-        return response.model_dump()
+        return await provider_pools["gemini"].run(
+            detect_conflicts, llm, request.google_results, request.reddit_results, mode=request.mode
+        )
+    except PoolSaturated as e:
+        raise _busy(e)
+    except RateLimited as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(math.ceil(e.retry_after or 1))})
     except Exception as e:
         print(f"Analysis Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/pools")
+def pool_status():
+    return {name: pool.stats() for name, pool in provider_pools.items()}
+
+@app.get("/api/providers")
+def providers():
+    status = {name: policy.breaker.stats() | {"state": policy.breaker.state} for name, policy in policies.items()}
+    for name, limiter in rate_limiters.items():
+        status.setdefault(name, {})["rate_limit"] = limiter.stats()
+    return status
+
+# --- STREAMING RESEARCH (Server-Sent Events) ---
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+async def _research_events(state, config):
+    with trace_run("research") as run_trace:
+        async for event in _graph_events(state, config, run_trace.trace_id):
+            yield event
+
+async def _graph_events(state, config, trace_id):
+    # Node outputs are pushed as soon as each node finishes; the synthesis
+    # answer additionally arrives token by token while it is generated.
+    run_id = config["configurable"]["thread_id"]
+    yield _sse("start", {"query": state["user_question"], "trace_id": trace_id, "run_id": run_id})
+    final_answer = None
+    missing_sources = []
+    status = {}
+    try:
+        # The first build imports LangGraph and compiles the graph: keep it off the event loop
+        graph = await asyncio.to_thread(get_graph)
+        async for mode, chunk in graph.astream(state, config, stream_mode=["updates", "custom"]):
+            if mode == "updates":
+                for node, update in chunk.items():
+                    if update and "final_answer" in update:
+                        final_answer = update["final_answer"]
+                    if update and update.get("provider_status"):
+                        status = update["provider_status"]
+                    if update and update.get("missing_sources"):
+                        missing_sources.extend(update["missing_sources"])
+                    yield _sse("node", {"node": node, "output": resolve_values(update) if update else update})
+            elif chunk.get("type") == "token":
+                yield _sse("token", {"content": chunk["content"]})
+    except Exception as e:
+        print(f"Research Stream Error: {e}")
+        yield _sse("error", {"detail": str(e)})
+        return
+    yield _sse("done", {
+        "final_answer": final_answer,
+        "missing_sources": list(dict.fromkeys(missing_sources)),
+        "provider_status": status,
+        "run_id": run_id,
+    })
+
+def _event_stream(state):
+    return StreamingResponse(
+        _research_events(state, run_config()),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.post("/api/research/stream")
+async def research_stream(request: ResearchRequest):
+    return _event_stream(initial_state(
+        request.query, request.latency_budget,
+        reddit_selector=request.reddit_selector, conflict_mode=request.conflict_mode,
+        page_fetch=request.page_fetch,
+    ))
+
+# GET variant so browsers can consume it with EventSource
+@app.get("/api/research/stream")
+async def research_stream_get(query: str, reddit_selector: Optional[str] = None, latency_budget: Optional[float] = None, conflict_mode: Optional[str] = None, page_fetch: Optional[bool] = None):
+    return _event_stream(initial_state(query, latency_budget, reddit_selector=reddit_selector, conflict_mode=conflict_mode, page_fetch=page_fetch))
+
+# --- BACKGROUND JOBS ---
+
+def _run_research_job(job, state, config):
+    # The latency budget starts when a worker picks the job up, not at submit
+    state = {**state, "started_at": time.time()}
+    with trace_run("research_job") as run_trace:
+        job.metadata["trace_id"] = run_trace.trace_id
+        for update in get_graph().stream(state, config, stream_mode="updates"):
+            job.progress.extend(update)
+            # Cancelling stops between nodes; the checkpoint stays resumable
+            job.check_cancelled()
+    return _run_result(config["configurable"]["thread_id"], get_graph().get_state(config).values)
+
+def _job_status(job):
+    return {**job.to_dict(), "position": research_jobs.position(job)}
+
+def _get_job(job_id):
+    job = research_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found (or its result expired)")
+    return job
+
+@app.post("/api/research/jobs", status_code=202)
+def submit_research_job(request: JobRequest, http_request: Request):
+    client = request.client_id or http_request.headers.get("X-Client-Id") or (http_request.client.host if http_request.client else "anonymous")
+    state = initial_state(
+        request.query, request.latency_budget,
+        reddit_selector=request.reddit_selector, conflict_mode=request.conflict_mode,
+        page_fetch=request.page_fetch,
+    )
+    config = run_config()
+    try:
+        job = research_jobs.submit(
+            _run_research_job, state, config,
+            client=client, priority=request.priority,
+            metadata={"run_id": config["configurable"]["thread_id"], "query": request.query},
+        )
+    except JobQueueFull as e:
+        raise _busy(e)
+    except ClientLimitExceeded as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "5"})
+    return _job_status(job)
+
+@app.get("/api/research/jobs/{job_id}")
+def read_research_job(job_id: str):
+    return _job_status(_get_job(job_id))
+
+@app.get("/api/research/jobs/{job_id}/result")
+def read_research_job_result(job_id: str):
+    job = _get_job(job_id)
+    if job.state == SUCCEEDED:
+        return job.result
+    if job.state in FINISHED:
+        raise HTTPException(status_code=409, detail=f"Job {job.state}: {job.error or 'no result'}")
+    # Still queued or running: poll again later
+    return JSONResponse(_job_status(job), status_code=202, headers={"Retry-After": "2"})
+
+@app.delete("/api/research/jobs/{job_id}")
+def cancel_research_job(job_id: str):
+    _get_job(job_id)
+    return _job_status(research_jobs.cancel(job_id))
+
+# --- BATCH RESEARCH ---
+
+def _batch_lines(request):
+    # JSON Lines: one result per question as it finishes, then a summary
+    started = time.time()
+    count = 0
+    concurrency = min(request.max_concurrency or BATCH_MAX_CONCURRENCY, BATCH_MAX_CONCURRENCY)
+    try:
+        for result in run_batch(
+            request.questions, max_concurrency=concurrency, latency_budget=request.latency_budget,
+            reddit_selector=request.reddit_selector, conflict_mode=request.conflict_mode,
+            page_fetch=request.page_fetch,
+        ):
+            count += 1
+            yield json.dumps(result, default=str) + "\n"
+    except Exception as e:
+        print(f"Batch Error: {e}")
+        yield json.dumps({"error": str(e)}) + "\n"
+        return
+    elapsed = time.time() - started
+    yield json.dumps({
+        "done": True, "questions": count, "elapsed": elapsed,
+        "questions_per_minute": count / elapsed * 60 if elapsed else 0.0,
+    }) + "\n"
+
+@app.post("/api/research/batch")
+def research_batch(request: BatchRequest):
+    if len(request.questions) > BATCH_MAX_QUESTIONS:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_QUESTIONS} questions per batch")
+    return StreamingResponse(_batch_lines(request), media_type="application/x-ndjson")
+
+# --- CHECKPOINTED RUNS ---
+
+def _run_result(run_id, values):
+    return {
+        "run_id": run_id,
+        "final_answer": values.get("final_answer"),
+        "conflict_report": values.get("conflict_report", {}),
+        "missing_sources": list(dict.fromkeys(values.get("missing_sources", []))),
+        "provider_status": values.get("provider_status", {}),
+    }
+
+@app.get("/api/research/{run_id}")
+def read_run(run_id: str):
+    snapshot = get_graph().get_state(run_config(run_id))
+    if not snapshot.values:
+        raise HTTPException(status_code=404, detail="Run not found")
+    return {**_run_result(run_id, snapshot.values), "pending_nodes": list(snapshot.next)}
+
+@app.post("/api/research/{run_id}/resume")
+async def resume_run(run_id: str):
+    try:
+        values = await provider_pools["graph"].run(resume_research, run_id)
+        return _run_result(run_id, values)
+    except PoolSaturated as e:
+        raise _busy(e)
+    except RunNotResumable as e:
+        raise HTTPException(status_code=410, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@app.post("/api/research/{run_id}/resynthesize")
+async def resynthesize_run(run_id: str, request: ResynthesizeRequest):
+    try:
+        values = await provider_pools["graph"].run(resynthesize, run_id, request.instructions)
+        return _run_result(run_id, values)
+    except PoolSaturated as e:
+        raise _busy(e)
+    except RunNotResumable as e:
+        raise HTTPException(status_code=410, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+# --- OBSERVABILITY ---
+
+@app.get("/metrics")
+def metrics():
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/traces")
+def list_traces():
+    return {"traces": recent_traces()}
+
+@app.get("/api/traces/{trace_id}")
+def read_trace(trace_id: str):
+    run_trace = get_trace(trace_id)
+    if run_trace is None:
+        raise HTTPException(status_code=404, detail="Trace not found")
+    return run_trace
+
 @app.get("/")
 def read_root():
     return {"status": "ok", "message": "Search Agent API is running"}
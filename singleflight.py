@@ -0,0 +1,63 @@
+import os
+import threading
+from concurrent.futures import Future
+
+from metrics import register_stats, add_to_span
+
+# --- SINGLE-FLIGHT COALESCING ---
+# When identical calls overlap (a trending query hitting the API from many
+# clients at once), the first caller becomes the leader and does the work.
+# Callers that arrive while it is still running are followers: they wait for
+# the leader's result (or exception) instead of calling upstream again.
+
+SINGLE_FLIGHT = os.getenv("SINGLE_FLIGHT", "1") == "1"
+
+class SingleFlight:
+    def __init__(self, name, enabled=SINGLE_FLIGHT):
+        self.name = name
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._stats = {"leaders": 0, "followers": 0}
+
+    def do(self, key, fn, *args, **kwargs):
+        if not self.enabled:
+            return fn(*args, **kwargs)
+
+        with self._lock:
+            future = self._flights.get(key)
+            leader = future is None
+            if leader:
+                future = self._flights[key] = Future()
+            self._stats["leaders" if leader else "followers"] += 1
+
+        if not leader:
+            add_to_span("coalesced_calls", 1)
+            return future.result()
+
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, "in_flight": len(self._flights)}
+
+
+flights = {
+    "search": SingleFlight("search"),
+    "reddit_thread": SingleFlight("reddit_thread"),
+    "page": SingleFlight("page"),
+    "llm": SingleFlight("llm"),
+}
+
+for _name, _flight in flights.items():
+    register_stats("singleflight", "group", _name, _flight.stats)
@@ -0,0 +1,141 @@
+import sys
+import json
+import argparse
+
+# --- GRAPH TOPOLOGY ---
+# Each node declares the state keys it reads and writes. An edge runs from the
+# node that writes a key to every node that reads it, so a node starts as soon
+# as its own inputs exist. Keys that no node writes are graph inputs (the
+# question, the budget, per-request overrides). Edges already implied by
+# another dependency are dropped.
+
+def node_dependencies(specs):
+    # specs: name -> (reads, writes). Returns name -> upstream nodes ([] = starts at START)
+    writers = {}
+    for name, (_, writes) in specs.items():
+        for key in writes:
+            if key in writers:
+                raise ValueError(f"state key {key!r} is written by both {writers[key]} and {name}")
+            writers[key] = name
+
+    direct = {
+        name: {writers[key] for key in reads if key in writers and writers[key] != name}
+        for name, (reads, _) in specs.items()
+    }
+    ancestors = {}
+    for name in topological_order(direct):
+        ancestors[name] = set().union(*(ancestors[dep] | {dep} for dep in direct[name]))
+    return {
+        name: [dep for dep in specs if dep in deps and not any(dep in ancestors[other] for other in deps)]
+        for name, deps in direct.items()
+    }
+
+def topological_order(deps):
+    order, done = [], set()
+    pending = dict(deps)
+    while pending:
+        ready = [name for name, upstream in pending.items() if set(upstream) <= done]
+        if not ready:
+            raise ValueError(f"dependency cycle between {', '.join(pending)}")
+        for name in ready:
+            order.append(name)
+            done.add(name)
+            del pending[name]
+    return order
+
+def sinks(deps):
+    # Nodes nothing waits for; these lead to END
+    upstream = {dep for deps_of in deps.values() for dep in deps_of}
+    return [name for name in deps if name not in upstream]
+
+
+# --- CRITICAL PATH ---
+def critical_path(deps, durations):
+    # Replays per-node durations (seconds) on the DAG with unlimited parallelism:
+    # every node starts when its slowest dependency finishes. Slack is how much
+    # later a node could finish without delaying the run.
+    order = topological_order(deps)
+    start, finish = {}, {}
+    for name in order:
+        start[name] = max((finish[dep] for dep in deps[name]), default=0.0)
+        finish[name] = start[name] + durations.get(name, 0.0)
+    makespan = max(finish.values(), default=0.0)
+
+    downstream = {name: [n for n in order if name in deps[n]] for name in order}
+    latest_finish = {}
+    for name in reversed(order):
+        latest_finish[name] = min((latest_finish[n] - durations.get(n, 0.0) for n in downstream[name]), default=makespan)
+
+    path = [max(order, key=finish.get)] if order else []
+    while path and deps[path[0]]:
+        path.insert(0, max(deps[path[0]], key=finish.get))
+
+    serial = sum(durations.get(name, 0.0) for name in order)
+    return {
+        "makespan": makespan,
+        "serial": serial,
+        "speedup": serial / makespan if makespan else 1.0,
+        "path": path,
+        "nodes": {
+            name: {"start": start[name], "finish": finish[name], "slack": latest_finish[name] - finish[name]}
+            for name in order
+        },
+    }
+
+def load_durations(path, nodes, stat="p50"):
+    # A benchmark.py --json report, a trace from /api/traces/{id}, or {node: seconds}
+    with open(path) as f:
+        data = json.load(f)
+    if "graph" in data:
+        rows = data["graph"]["latency"]
+        return {name: rows[name][stat] for name in nodes if name in rows}
+    if "spans" in data:
+        durations = {}
+        for record in data["spans"]:
+            if record["kind"] == "node" and record["name"] in nodes:
+                durations[record["name"]] = durations.get(record["name"], 0.0) + record["end_time"] - record["start_time"]
+        return durations
+    return {name: float(data[name]) for name in nodes if name in data}
+
+
+def print_report(deps, durations, label=""):
+    result = critical_path(deps, durations)
+    chain = " -> ".join(f"{name} {durations.get(name, 0.0):.2f}s" for name in result["path"])
+    print(f"Critical path{label}: {chain}")
+    print(f"  parallel {result['makespan']:.2f}s, serial {result['serial']:.2f}s, speedup {result['speedup']:.2f}x")
+    slack = sorted(((info["slack"], name) for name, info in result["nodes"].items() if info["slack"] > 1e-9), reverse=True)
+    if slack:
+        print("  slack: " + ", ".join(f"{name} {seconds:.2f}s" for seconds, name in slack))
+    return result
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Print the graph's derived edges and replay node timings on them")
+    parser.add_argument("timings", nargs="?", help="benchmark.py --json report, trace JSON or {node: seconds}")
+    parser.add_argument("--stat", default="p50", help="latency statistic to use from a benchmark report")
+    parser.add_argument("--add-edge", action="append", default=[], metavar="SRC:DST",
+                        help="what-if: make DST also wait for SRC (repeatable)")
+    args = parser.parse_args(argv)
+
+    from main import NODE_DEPENDENCIES
+    deps = NODE_DEPENDENCIES
+    print("Edges (derived from state reads/writes):")
+    for name in topological_order(deps):
+        print(f"  {' + '.join(deps[name]) or 'START'} -> {name}")
+    print(f"  {' + '.join(sinks(deps))} -> END")
+    if not args.timings:
+        return
+
+    durations = load_durations(args.timings, deps, args.stat)
+    print()
+    result = print_report(deps, durations)
+    if args.add_edge:
+        alternative = {name: list(upstream) for name, upstream in deps.items()}
+        for edge in args.add_edge:
+            source, target = edge.split(":")
+            alternative[target].append(source)
+        print()
+        other = print_report(alternative, durations, " (with added edges)")
+        print(f"  derived topology saves {other['makespan'] - result['makespan']:.2f}s per run")
+
+if __name__ == "__main__":
+    sys.exit(main())
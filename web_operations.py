@@ -3,24 +3,83 @@ import warnings
 warnings.filterwarnings("ignore", category=RuntimeWarning, module="duckduckgo_search")
 
 import os
-import requests
-from serpapi import GoogleSearch
-from duckduckgo_search import DDGS
+import re
+import json
+import time
+import codecs
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait
+from urllib.parse import urlsplit, urlunsplit, urlencode
+
+from cache import search_cache, search_cache_key, SEARCH_CACHE_TTLS
+from executors import host_semaphore
+from metrics import traced, record_bytes, record_error
+from ranking import term_coverage
+from resilience import resilient_call, ProviderError, DeadlineExpired
+from singleflight import flights
+
+# Provider SDKs are imported on first use (they are slow to import); tests
+# and the benchmark may assign stand-ins to these names instead.
+GoogleSearch = None
+DDGS = None
+
+def _google_search_client():
+    global GoogleSearch
+    if GoogleSearch is None:
+        from serpapi import GoogleSearch
+    return GoogleSearch
+
+def _ddgs_client():
+    global DDGS
+    if DDGS is None:
+        from duckduckgo_search import DDGS
+    return DDGS
+
+SERP_NUM_RESULTS = int(os.getenv("SERP_NUM_RESULTS", "5"))
+DDG_MAX_RESULTS = int(os.getenv("DDG_MAX_RESULTS", "5"))
+# The serpapi client's own default is 60000s; a hung search would pin a deadline worker indefinitely
+SERPAPI_TIMEOUT = float(os.getenv("SERPAPI_TIMEOUT", "10"))
+
+def _cached_search(provider, engine, query, num, fetch):
+    key = search_cache_key(engine, query, num)
+    hit, results = search_cache.get(key)
+    if hit:
+        print(f"--- [Cache] {provider} hit: {query} ---")
+        return results
+
+    # Identical searches already in flight share that call's result
+    results = flights["search"].do((provider, key), fetch)
+    # Errors come back as [], never cache those
+    if results:
+        search_cache.set(key, results, ttl=SEARCH_CACHE_TTLS[provider])
+    return results
 
 # --- 1. GOOGLE SEARCH (SerpApi) ---
-def serp_search(query, engine="google"):
+def _serp_fetch(params):
+    search = _google_search_client()(params)
+    search.timeout = SERPAPI_TIMEOUT  # GoogleSearch() takes no timeout argument
+    results = search.get_dict()
+    record_bytes("serpapi", len(json.dumps(results)))
+    # SerpApi reports quota/auth problems in the body instead of raising
+    error = results.get("error")
+    if error and "returned any results" not in error:
+        raise ProviderError(f"SerpApi error: {error}")
+    return results
+
+@traced("tool", "serpapi")
+def _serp_search(query, engine="google", num=SERP_NUM_RESULTS):
     print(f"--- [Tool] Searching Google via SerpApi: {query} ---")
     
     params = {
         "engine": engine,
         "q": query,
         "api_key": os.getenv("SERP_API_KEY"),
-        "num": 5
+        "num": num
     }
 
     try:
-        search = GoogleSearch(params)
-        results = search.get_dict()
+        results = resilient_call("serpapi", _serp_fetch, params)
         organic = results.get("organic_results", [])
         
         cleaned_results = []
@@ -34,14 +93,32 @@ def serp_search(query, engine="google"):
 
     except Exception as e:
         print(f"Error in serp_search: {e}")
+        record_error("tool", "serpapi")
         return []
 
+def serp_search(query, engine="google", num=SERP_NUM_RESULTS):
+    return _cached_search("serpapi", engine, query, num, lambda: _serp_search(query, engine, num))
+
 # --- 2. DUCKDUCKGO SEARCH (Free) ---
-def duckduckgo_search(query):
+def _ddg_text(query, max_results):
+    # The library's own rate-limit and timeout errors, mapped onto what
+    # resilient_call retries (matched by name: the module is imported lazily)
+    try:
+        return _ddgs_client()().text(keywords=query, max_results=max_results)
+    except Exception as e:
+        if type(e).__name__ == "RatelimitException":
+            raise ProviderError(f"DuckDuckGo rate limited: {e}", status=429) from e
+        if type(e).__name__ == "TimeoutException":
+            raise TimeoutError(f"DuckDuckGo timed out: {e}") from e
+        raise
+
+@traced("tool", "duckduckgo")
+def _duckduckgo_search(query, max_results=DDG_MAX_RESULTS):
     print(f"--- [Tool] Searching DuckDuckGo: {query} ---")
     try:
         # DDGS returns 'href' for link and 'body' for snippet
-        results = DDGS().text(keywords=query, max_results=5)
+        results = resilient_call("duckduckgo", _ddg_text, query, max_results)
+        record_bytes("duckduckgo", len(json.dumps(results)))
         
         cleaned_results = []
         for r in results:
@@ -53,51 +130,339 @@ def duckduckgo_search(query):
         return cleaned_results
     except Exception as e:
         print(f"Error in DuckDuckGo search: {e}")
+        record_error("tool", "duckduckgo")
         return []
 
+def duckduckgo_search(query, max_results=DDG_MAX_RESULTS):
+    return _cached_search("duckduckgo", "duckduckgo", query, max_results, lambda: _duckduckgo_search(query, max_results))
+
 # --- 3. REDDIT SEARCH (Via Google Site Search) ---
-def reddit_search_api(keyword):
+def reddit_search_api(keyword, num=SERP_NUM_RESULTS):
     # We use Google restricted to reddit.com for better results
     query = f"site:reddit.com {keyword}"
-    return serp_search(query, engine="google")
+    return _cached_search("reddit", "google", query, num, lambda: _serp_search(query, "google", num))
 
 # --- 4. REDDIT SCRAPER (Direct JSON) ---
-def reddit_post_retrieval(urls):
+# Custom User-Agent is required for Reddit
+REDDIT_HEADERS = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
+
+REDDIT_REQUEST_TIMEOUT = float(os.getenv("REDDIT_REQUEST_TIMEOUT", "10"))
+REDDIT_SCRAPE_DEADLINE = float(os.getenv("REDDIT_SCRAPE_DEADLINE", "15"))
+REDDIT_MAX_WORKERS = int(os.getenv("REDDIT_MAX_WORKERS", "8"))
+REDDIT_PER_HOST_LIMIT = int(os.getenv("REDDIT_PER_HOST_LIMIT", "4"))
+# Thread size limits: Reddit trims the comment tree server-side (limit/depth/
+# sort), the streaming parser stops reading after REDDIT_MAX_BYTES, and the
+# text handed to the LLM is capped at REDDIT_THREAD_CHARS per thread.
+REDDIT_STREAM_PARSE = os.getenv("REDDIT_STREAM_PARSE", "1") == "1"
+REDDIT_MAX_BYTES = int(os.getenv("REDDIT_MAX_BYTES", "1048576"))
+REDDIT_THREAD_CHARS = int(os.getenv("REDDIT_THREAD_CHARS", "4000"))
+REDDIT_COMMENT_LIMIT = int(os.getenv("REDDIT_COMMENT_LIMIT", "100"))
+REDDIT_COMMENT_DEPTH = int(os.getenv("REDDIT_COMMENT_DEPTH", "3"))
+REDDIT_COMMENT_SORT = os.getenv("REDDIT_COMMENT_SORT", "top")
+REDDIT_DEPTH_DECAY = float(os.getenv("REDDIT_DEPTH_DECAY", "0.5"))
+# Bulk mode: one /by_id/ listing request returns title, text, score and comment
+# count for up to 100 threads; comment trees are then fetched only for threads
+# that clear the thresholds, the rest contribute their post text alone.
+REDDIT_BASE_URL = os.getenv("REDDIT_BASE_URL", "https://www.reddit.com").rstrip("/")
+REDDIT_BULK = os.getenv("REDDIT_BULK", "0") == "1"
+REDDIT_MIN_SCORE = int(os.getenv("REDDIT_MIN_SCORE", "1"))
+REDDIT_MIN_COMMENTS = int(os.getenv("REDDIT_MIN_COMMENTS", "1"))
+REDDIT_MIN_RELEVANCE = float(os.getenv("REDDIT_MIN_RELEVANCE", "0.2"))
+REDDIT_BY_ID_BATCH = 100
+
+_http_session = None
+_http_session_lock = threading.Lock()
+
+def get_http_session():
+    # One keep-alive connection pool shared by every scraper thread
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=REDDIT_MAX_WORKERS, pool_maxsize=REDDIT_MAX_WORKERS)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _http_session = session
+        return _http_session
+
+def _reddit_json_url(url):
+    # Trick: Add .json to the URL to get raw data; share-link query strings are dropped
+    parts = urlsplit(url)
+    query = urlencode({"limit": REDDIT_COMMENT_LIMIT, "depth": REDDIT_COMMENT_DEPTH, "sort": REDDIT_COMMENT_SORT})
+    return urlunsplit((parts.scheme, parts.netloc, parts.path.rstrip("/") + ".json", query, ""))
+
+def _flatten_comments(children, depth=0):
+    # (depth, score, body) for every readable comment down to REDDIT_COMMENT_DEPTH;
+    # "more" stubs, deleted/removed bodies and stickied (mod) comments are skipped
+    for child in children:
+        if child.get("kind") != "t1":
+            continue
+        data = child.get("data", {})
+        body = (data.get("body") or "").strip()
+        if body and body not in ("[deleted]", "[removed]") and not data.get("stickied"):
+            yield depth, data.get("score") or 0, body
+        replies = data.get("replies")
+        if isinstance(replies, dict) and depth + 1 < REDDIT_COMMENT_DEPTH:
+            yield from _flatten_comments(replies.get("data", {}).get("children", []), depth + 1)
+
+def _truncate(text, limit):
+    # At most limit characters, cut at a word boundary
+    if len(text) <= limit:
+        return text
+    if limit <= 1:
+        return ""
+    return text[:limit - 1].rsplit(" ", 1)[0] + "…"
+
+def _select_comments(comments, budget):
+    # Highest score first, each reply level weighted down by REDDIT_DEPTH_DECAY;
+    # the budget (separators included) is filled greedily and the last comment
+    # may be cut short
+    ranked = sorted(comments, key=lambda c: c[1] * REDDIT_DEPTH_DECAY ** c[0], reverse=True)
+    selected, used = [], 0
+    for _, _, body in ranked:
+        remaining = budget - used - (3 if selected else 0)  # " | " separator
+        if len(body) <= remaining:
+            used = budget - remaining + len(body)
+            selected.append(body)
+        elif remaining >= 200:
+            selected.append(_truncate(body, remaining))
+            break
+    return selected
+
+_THREAD_LABELS = len("Title: \nPost: \nComments: ")
+
+def _format_thread(post_data, comments, budget=REDDIT_THREAD_CHARS):
+    # The whole formatted thread, labels included, stays within budget. The
+    # title is capped at a quarter of it, the post body may use half of what
+    # is left, and comments get the rest
+    budget = max(0, budget - _THREAD_LABELS)
+    title = _truncate(post_data.get("title") or "No Title", budget // 4)
+    selftext = _truncate(post_data.get("selftext") or "", (budget - len(title)) // 2)
+    comments_text = _select_comments(comments, budget - len(title) - len(selftext))
+    return f"Title: {title}\nPost: {selftext}\nComments: {' | '.join(comments_text)}"
+
+def _parse_reddit_thread(data):
+    # Reddit JSON structure: [Post_Object, Comments_Object]
+    post_data = data[0]['data']['children'][0]['data']
+    return post_data, list(_flatten_comments(data[1]['data']['children']))
+
+_json_decoder = json.JSONDecoder()
+_CHILDREN_RE = re.compile(r'(?<!\\)"children"\s*:\s*\[')
+_SKIP_RE = re.compile(r"[\s,]*")
+
+def _parse_reddit_stream(chunks, max_bytes=REDDIT_MAX_BYTES, enough_chars=REDDIT_THREAD_CHARS * 3):
+    # Incremental version of _parse_reddit_thread. raw_decode takes the post
+    # listing as soon as it is complete, then each top-level comment (with its
+    # replies) one at a time; the buffer only ever holds the unparsed tail.
+    # Reading stops at max_bytes or once enough comment text has arrived; with
+    # sort=top the best comments come first. Returns (post_data, comments,
+    # bytes_read, complete).
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    buffer, stage = "", "open"
+    post_data, comments, collected, received = None, [], 0, 0
+    for chunk in chunks:
+        received += len(chunk)
+        buffer += decoder.decode(chunk)
+        pos = 0
+        while stage != "done":
+            if stage == "open":
+                start = buffer.find("[", pos)
+                if start < 0:
+                    break
+                pos, stage = start + 1, "post"
+            elif stage == "children":
+                match = _CHILDREN_RE.search(buffer, pos)
+                if not match:
+                    break
+                pos, stage = match.end(), "comments"
+            else:
+                pos = _SKIP_RE.match(buffer, pos).end()
+                if pos >= len(buffer):
+                    break
+                if stage == "comments" and buffer[pos] == "]":
+                    stage = "done"
+                    break
+                try:
+                    value, pos = _json_decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    break  # incomplete, wait for more bytes
+                if stage == "post":
+                    post_data, stage = value["data"]["children"][0]["data"], "children"
+                else:
+                    found = list(_flatten_comments([value]))
+                    comments.extend(found)
+                    collected += sum(len(body) for _, _, body in found)
+        buffer = buffer[pos:]
+        if stage == "done" or collected >= enough_chars or received >= max_bytes:
+            break
+
+    if post_data is None:
+        raise ValueError(f"no post found in the first {received} bytes")
+    return post_data, comments, received, stage == "done"
+
+def _until(chunks, deadline_at):
+    # Stop reading the body once the scrape deadline has passed
+    for chunk in chunks:
+        yield chunk
+        if time.monotonic() >= deadline_at:
+            return
+
+def _stream_reddit_json(session, json_url, deadline_at):
+    with host_semaphore("reddit", json_url, REDDIT_PER_HOST_LIMIT):
+        remaining = deadline_at - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExpired("scrape deadline expired before request started")
+        with session.get(json_url, headers=REDDIT_HEADERS, timeout=min(REDDIT_REQUEST_TIMEOUT, remaining), stream=True) as response:
+            if response.status_code == 429 or response.status_code >= 500:
+                raise ProviderError(
+                    f"Reddit returned {response.status_code}",
+                    status=response.status_code,
+                    retry_after=response.headers.get("Retry-After"),
+                )
+            if response.status_code != 200:
+                return None
+            post_data, comments, received, complete = _parse_reddit_stream(_until(response.iter_content(65536), deadline_at))
+
+    record_bytes("reddit", received)
+    if not complete:
+        print(f"--- [Reddit] Stopped reading {json_url} after {received} bytes ({len(comments)} comments) ---")
+    return post_data, comments
+
+def _get_reddit_json(session, json_url, deadline_at):
+    with host_semaphore("reddit", json_url, REDDIT_PER_HOST_LIMIT):
+        remaining = deadline_at - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExpired("scrape deadline expired before request started")
+        response = session.get(json_url, headers=REDDIT_HEADERS, timeout=min(REDDIT_REQUEST_TIMEOUT, remaining))
+
+    record_bytes("reddit", len(response.content))
+    # Rate limiting and server errors are worth a retry; anything else is final
+    if response.status_code == 429 or response.status_code >= 500:
+        raise ProviderError(
+            f"Reddit returned {response.status_code}",
+            status=response.status_code,
+            retry_after=response.headers.get("Retry-After"),
+        )
+    return response
+
+@traced("tool", "reddit_thread")
+def _fetch_reddit_thread(session, url, deadline_at):
+    json_url = _reddit_json_url(url)
+    if REDDIT_STREAM_PARSE:
+        thread = resilient_call("reddit", _stream_reddit_json, session, json_url, deadline_at, deadline_at=deadline_at)
+    else:
+        response = resilient_call("reddit", _get_reddit_json, session, json_url, deadline_at, deadline_at=deadline_at)
+        thread = _parse_reddit_thread(response.json()) if response.status_code == 200 else None
+    return None if thread is None else _format_thread(*thread)
+
+_THREAD_ID_RE = re.compile(r"(?:/comments/|redd\.it/)([a-z0-9]+)", re.IGNORECASE)
+
+def reddit_thread_id(url):
+    match = _THREAD_ID_RE.search(url)
+    return match.group(1).lower() if match else None
+
+@traced("tool", "reddit_by_id")
+def reddit_thread_metadata(urls, session, deadline_at):
+    # url -> post data for every thread Reddit still has; one request per 100 ids
+    ids = {url: reddit_thread_id(url) for url in urls}
+    unique = [thread_id for thread_id in dict.fromkeys(ids.values()) if thread_id]
+    posts = {}
+    for i in range(0, len(unique), REDDIT_BY_ID_BATCH):
+        names = ",".join(f"t3_{thread_id}" for thread_id in unique[i:i + REDDIT_BY_ID_BATCH])
+        json_url = f"{REDDIT_BASE_URL}/by_id/{names}.json"
+        response = resilient_call("reddit", _get_reddit_json, session, json_url, deadline_at, deadline_at=deadline_at)
+        if response.status_code != 200:
+            continue
+        for child in response.json()["data"]["children"]:
+            posts[child["data"]["id"].lower()] = child["data"]
+    return {url: posts[thread_id] for url, thread_id in ids.items() if thread_id in posts}
+
+def _wants_comments(post_data, query=None):
+    # Worth a comment-tree request: upvoted, has comments and (given the
+    # question) mentions enough of its terms in the title or post
+    if (post_data.get("score") or 0) < REDDIT_MIN_SCORE or (post_data.get("num_comments") or 0) < REDDIT_MIN_COMMENTS:
+        return False
+    if query and REDDIT_MIN_RELEVANCE > 0:
+        text = f"{post_data.get('title', '')} {post_data.get('selftext', '')}"
+        return term_coverage(query, text) >= REDDIT_MIN_RELEVANCE
+    return True
+
+def _scrape_threads(urls, session, deadline, deadline_at, max_workers=None):
+    # url -> thread text, fetched in parallel; threads that fail or miss the
+    # overall deadline are left out
+    if not urls:
+        return {}
+    workers = min(max_workers or REDDIT_MAX_WORKERS, len(urls))
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="reddit-scrape")
+    try:
+        # Copy the context so per-thread spans land in the caller's trace.
+        # Threads another request is already fetching are not fetched twice.
+        futures = [
+            executor.submit(contextvars.copy_context().run, flights["reddit_thread"].do, url, _fetch_reddit_thread, session, url, deadline_at)
+            for url in urls
+        ]
+        wait(futures, timeout=max(0.0, deadline_at - time.monotonic()))
+
+        texts = {}
+        for url, future in zip(urls, futures):
+            if not future.done():
+                future.cancel()
+                print(f"Failed to scrape {url}: deadline of {deadline}s exceeded")
+                record_error("tool", "reddit_scrape")
+                continue
+            try:
+                text = future.result()
+            except Exception as e:
+                print(f"Failed to scrape {url}: {e}")
+                record_error("tool", "reddit_scrape")
+                continue
+            if text is not None:
+                texts[url] = text
+        return texts
+    finally:
+        # Don't block on stragglers; their own timeouts are capped by the deadline
+        executor.shutdown(wait=False, cancel_futures=True)
+
+@traced("tool", "reddit_scrape")
+def reddit_post_retrieval_concurrent(urls, deadline=None, max_workers=None, query=None, max_threads=None):
+    # Fetches every thread in parallel (the first max_threads); results keep
+    # the input order. In bulk mode max_threads counts threads that clear the
+    # thresholds first, and a thread whose comments were skipped, failed or
+    # missed the deadline still contributes its post text from the listing.
     print(f"--- [Tool] Scraping {len(urls)} Reddit Threads ---")
-    
-    extracted_content = []
-    # Custom User-Agent is required for Reddit
-    headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
+    if not urls:
+        return []
 
-    for url in urls:
+    deadline = REDDIT_SCRAPE_DEADLINE if deadline is None else deadline
+    deadline_at = time.monotonic() + deadline
+    session = get_http_session()
+
+    posts = {}
+    if REDDIT_BULK:
         try:
-            # Trick: Add .json to the URL to get raw data
-            json_url = url.rstrip("/") + ".json"
-            
-            response = requests.get(json_url, headers=headers, timeout=10)
-            
-            if response.status_code == 200:
-                data = response.json()
-                
-                # Reddit JSON structure: [Post_Object, Comments_Object]
-                post_data = data[0]['data']['children'][0]['data']
-                comments_data = data[1]['data']['children']
-                
-                title = post_data.get("title", "No Title")
-                selftext = post_data.get("selftext", "")
-                
-                # Extract top 5 comments
-                comments_text = []
-                for i, comment in enumerate(comments_data):
-                    if i > 5: break
-                    if 'body' in comment['data']:
-                        comments_text.append(comment['data']['body'])
-                
-                full_text = f"Title: {title}\nPost: {selftext}\nComments: {' | '.join(comments_text)}"
-                extracted_content.append(full_text)
-                
+            posts = reddit_thread_metadata(urls, session, deadline_at)
         except Exception as e:
-            print(f"Failed to scrape {url}: {e}")
+            print(f"--- [Reddit] by_id lookup failed, fetching every thread: {e} ---")
+            record_error("tool", "reddit_by_id")
+    to_fetch = [url for url in urls if url not in posts or _wants_comments(posts[url], query)]
+    keep = (to_fetch + [url for url in urls if url not in to_fetch])[:max_threads]
+    to_fetch = [url for url in to_fetch if url in keep]
+    if posts and len(to_fetch) < len(keep):
+        print(f"--- [Reddit] Fetching comments for {len(to_fetch)} of {len(keep)} threads ---")
+    texts = _scrape_threads(to_fetch, session, deadline, deadline_at, max_workers)
+
+    extracted_content = []
+    for url in urls:
+        if url not in keep:
             continue
+        text = texts.get(url)
+        if text is None and url in posts:
+            text = _format_thread(posts[url], [])
+        if text is not None:
+            extracted_content.append(text)
+    return extracted_content
 
-    return extracted_content
\ No newline at end of file
+def reddit_post_retrieval(urls, deadline=None, query=None, max_threads=None):
+    return reddit_post_retrieval_concurrent(urls, deadline=deadline, query=query, max_threads=max_threads)